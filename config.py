@@ -9,5 +9,12 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD", "postgres"),
 }
 
+# Size of the connection pool shared by the API requests
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "4"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "32"))
+
+# Worker processes parsing XML files during an import, 0 uses all available CPUs
+IMPORT_PROCESSES = int(os.getenv("IMPORT_PROCESSES", "0"))
+
 # Data directory configuration
 DATA_DIR = os.getenv("DATA_DIR", "data")
@@ -1,11 +1,15 @@
+import atexit
+import io
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 
-import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+import psycopg2.extensions
+import psycopg2.pool
 
-from config import DB_CONFIG
+from config import DB_CONFIG, DB_POOL_MAX_CONN, DB_POOL_MIN_CONN
 
 
 def get_db_connection(max_retries=5, retry_delay=1):
@@ -22,6 +26,85 @@ def get_db_connection(max_retries=5, retry_delay=1):
             raise Exception(f"Failed to connect to database after {max_retries} attempts: {last_exception!s}")
 
 
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements have been prepared in its session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+def execute_prepared(cur, name, sql, params=()):
+    """Execute a query as a named prepared statement, preparing it on first use per connection.
+
+    The query uses $1, $2, ... placeholders. Once prepared, later executions on the same
+    connection skip parsing and planning it.
+    """
+    prepared_statements = cur.connection.prepared_statements
+    if name not in prepared_statements:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        prepared_statements.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+# Shared pool for short-lived server queries, created on first use
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool(minconn=DB_POOL_MIN_CONN, maxconn=DB_POOL_MAX_CONN):
+    """Return the shared connection pool, creating it on first use.
+
+    maxconn should cover the number of concurrent request threads, since a request
+    fails if every connection is in use.
+    """
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                minconn, maxconn, connection_factory=PooledConnection, **DB_CONFIG
+            )
+            atexit.register(close_connection_pool)
+        return _connection_pool
+
+
+def close_connection_pool():
+    """Close all pooled connections, so their database sessions end cleanly on shutdown."""
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is not None:
+            _connection_pool.closeall()
+            _connection_pool = None
+
+
+@contextmanager
+def pooled_db_connection():
+    """Borrow a connection from the shared pool and hand it back afterwards.
+
+    Connections are checked with SELECT 1 on checkout so that ones broken by a database
+    restart are replaced instead of failing the request. They run in autocommit mode,
+    so read-only queries do not leave transactions open on idle pooled connections.
+    """
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+        conn.autocommit = True
+
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
 def init_database():
     """Initialize the database by running all migrations."""
     conn = get_db_connection()
@@ -46,52 +129,100 @@ def init_database():
         conn.close()
 
 
+def prepare_import_statements(conn):
+    """Prepare the statements run for every date of an import on this connection.
+
+    Prepared statements live for the whole session, so each date skips parsing and planning
+    them again. Must be called once per connection before is_date_processed or
+    mark_date_as_processed.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "PREPARE is_date_processed (date) AS SELECT EXISTS(SELECT 1 FROM processed_dates WHERE date = $1)"
+        )
+        cur.execute(
+            "PREPARE mark_date_as_processed (date) AS "
+            "INSERT INTO processed_dates (date) VALUES ($1) ON CONFLICT (date) DO NOTHING"
+        )
+
+
 def is_date_processed(conn, date_str):
     """Check if a specific date has already been processed."""
     with conn.cursor() as cur:
-        cur.execute("SELECT EXISTS(SELECT 1 FROM processed_dates WHERE date = %s)", (date_str,))
+        cur.execute("EXECUTE is_date_processed (%s)", (date_str,))
         return cur.fetchone()[0]
 
 
 def mark_date_as_processed(conn, date_str):
-    """Mark a date as processed in the database."""
+    """Mark a date as processed in the database. The caller is responsible for committing."""
     with conn.cursor() as cur:
-        cur.execute(
-            "INSERT INTO processed_dates (date) VALUES (%s) ON CONFLICT (date) DO NOTHING",
-            (date_str,),
-        )
-    conn.commit()
+        cur.execute("EXECUTE mark_date_as_processed (%s)", (date_str,))
 
 
-def bulk_insert_train_data(conn, data_df):
-    """Insert a DataFrame of train data into the database."""
-    if data_df.empty:
-        return
+def refresh_station_views(conn):
+    """Refresh the materialized station and train lists after new data was imported.
 
-    # Create a copy to avoid modifying the original DataFrame
-    df_to_insert = data_df.copy()
-
-    # Convert all numeric columns to native Python types
-    numeric_columns = df_to_insert.select_dtypes(include=["int32", "int64", "float32", "float64"]).columns
-    for col in numeric_columns:
-        df_to_insert[col] = df_to_insert[col].astype(float).astype(object)
-
-    # Convert DataFrame to list of tuples, ensuring native Python types
-    values = [tuple(None if pd.isna(x) else x for x in row) for row in df_to_insert.values]
-
-    # Generate the column names string
-    columns = df_to_insert.columns.tolist()
+    CONCURRENTLY keeps the views readable by the API while they are rebuilt. The caller is
+    responsible for committing.
+    """
+    with conn.cursor() as cur:
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_train_stations")
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_station_trains")
+
+
+class DataFrameCsvStream:
+    """File-like object serializing a DataFrame to CSV chunk by chunk as COPY reads it."""
+
+    def __init__(self, df, chunk_size=10000):
+        self._chunks = (df.iloc[i : i + chunk_size] for i in range(0, len(df), chunk_size))
+        self._current = io.StringIO()
+
+    def read(self, size=-1):
+        while True:
+            data = self._current.read(size)
+            if data:
+                return data
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return ""
+            self._current = io.StringIO(
+                chunk.to_csv(index=False, header=False, na_rep="", date_format="%Y-%m-%d %H:%M:%S")
+            )
+
+
+def bulk_insert_train_data(conn, data_df, chunk_size=10000):
+    """Insert a DataFrame of train data into the database using COPY.
+
+    Rows are copied into a temporary staging table first and then moved into train_data,
+    skipping stops that are already stored, so a retried import never creates duplicates.
+    The caller is responsible for committing, so several inserts can share one transaction.
+    Returns the number of rows actually inserted.
+    """
+    if data_df.empty:
+        return 0
 
+    # Missing values are serialized as empty fields, which COPY loads as NULL.
+    # Rows are serialized in chunks so the full CSV text is never held in memory.
+    columns = ", ".join(data_df.columns)
     with conn.cursor() as cur:
-        # Use execute_values for efficient bulk insertion
-        execute_values(
-            cur,
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS tmp_train_data ON COMMIT DROP AS
+            SELECT {columns} FROM train_data WITH NO DATA
+            """
+        )
+        cur.copy_expert(
+            f"COPY tmp_train_data ({columns}) FROM STDIN WITH (FORMAT CSV, NULL '')",
+            DataFrameCsvStream(data_df, chunk_size=chunk_size),
+        )
+        cur.execute(
             f"""
-            INSERT INTO train_data (
-                {", ".join(columns)}
-            ) VALUES %s
-            """,
-            values,
-            page_size=1000,
+            INSERT INTO train_data ({columns})
+            SELECT {columns} FROM tmp_train_data
+            ON CONFLICT DO NOTHING
+            """
         )
-    conn.commit()
+        inserted_rows = cur.rowcount
+        # The staging table lives until commit, empty it for the next date in the batch
+        cur.execute("TRUNCATE tmp_train_data")
+    return inserted_rows
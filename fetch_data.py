@@ -1,14 +1,17 @@
 import os
 import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from threading import Lock
 from time import time as current_time
-from xml.dom.minidom import parseString
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from tqdm import tqdm
 
 
 class RateLimiter:
@@ -30,20 +33,30 @@ class RateLimiter:
         self.last_update = now
 
     def acquire(self):
-        """Acquire a token, waiting if necessary."""
-        with self.lock:
-            while self.tokens < 1:
+        """Acquire a token, sleeping until one has accrued if necessary."""
+        while True:
+            with self.lock:
+                # Refill on every call, so time spent idle with a full bucket is not credited later
                 self._add_tokens()
-                if self.tokens < 1:
-                    time.sleep(0.1)  # Sleep briefly to prevent busy waiting
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                # Time until the missing fraction of a token is refilled
+                wait = (1 - self.tokens) * self.per / self.rate
 
-            self.tokens -= 1
-            return True
+            # Sleep without holding the lock so other threads are not blocked
+            time.sleep(wait)
 
 
 # Create a global rate limiter instance
 rate_limiter = RateLimiter(rate=50, per=60)  # 50 requests per minute
 
+# Shared session whose connection pool is sized for the fetch worker threads, so
+# TCP and TLS connections to the DB API are kept alive and reused across requests.
+# Retries stay in save_api_data so every attempt still passes through the rate limiter.
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
 
 def get_api_credentials():
     """Get API credentials from environment variables."""
@@ -67,7 +80,7 @@ def get_api_headers(api_key, client_id):
     }
 
 
-def save_api_data(formatted_url, save_path, headers, prettify=True, max_retries=4, skip_if_exists=False):
+def save_api_data(formatted_url, save_path, headers, prettify=True, max_retries=4):
     """Save API data to file with retries and rate limiting.
 
     Args:
@@ -76,27 +89,24 @@ def save_api_data(formatted_url, save_path, headers, prettify=True, max_retries=
         headers: HTTP headers for the request.
         prettify: Whether to prettify the XML output.
         max_retries: Number of retry attempts.
-        skip_if_exists: If True, skip fetching if save_path already exists.
     """
-    if skip_if_exists and save_path.exists():
-        print(f"SKIPPED (exists): {save_path.name}")
-        return
-
     for attempt in range(max_retries):
         try:
             # Acquire a token before making the request
             rate_limiter.acquire()
 
-            response = requests.get(formatted_url, headers=headers, timeout=10)
+            response = session.get(formatted_url, headers=headers, timeout=10)
             response.raise_for_status()
             if attempt > 0:
                 print(f"Success after {attempt} attempts.")
 
-            with save_path.open("w") as f:
-                if prettify:
-                    f.write(parseString(response.content).toprettyxml())
-                else:
-                    f.write(parseString(response.content).toxml())
+            if prettify:
+                root = ET.fromstring(response.content)
+                ET.indent(root)
+                save_path.write_bytes(ET.tostring(root, encoding="utf-8", xml_declaration=True))
+            else:
+                # Store the response as received, there is nothing to gain from re-serializing it
+                save_path.write_bytes(response.content)
 
             print("SUCCESS:", formatted_url)
             return  # Success, exit the function
@@ -104,8 +114,9 @@ def save_api_data(formatted_url, save_path, headers, prettify=True, max_retries=
         except (RequestException, ConnectionError) as e:
             print(f"Attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
-                print("Retrying in 1 seconds...")
-                time.sleep(1)
+                delay = 2**attempt  # exponential backoff: 1s, 2s, 4s, ...
+                print(f"Retrying in {delay} seconds...")
+                time.sleep(delay)
             else:
                 print(f"Failed to fetch data after {max_retries} attempts: {formatted_url}")
 
@@ -118,6 +129,7 @@ def fetch_data(
     eva_file="current_eva_list.csv",
     xml_dir="/app/data/xml",
     eva_dir="/app/data/eva",
+    max_workers=16,
 ):
     """
     Main function to fetch data that can be called directly or via command line.
@@ -128,6 +140,8 @@ def fetch_data(
         eva_file (str): Path to the CSV file containing EVA numbers.
         xml_dir (str): Path to the directory where XML files will be saved.
         eva_dir (str): Path to the directory where EVA files will be saved.
+        max_workers (int): Number of concurrent fetch threads. The shared rate limiter
+            still caps the overall request rate.
     """
     if api_key is None or client_id is None:
         api_key, client_id = get_api_credentials()
@@ -148,27 +162,47 @@ def fetch_data(
     for evas in df["evas"]:
         eva_list.extend(evas.split(","))
 
+    # Scan the folder once instead of checking every plan file separately
+    with os.scandir(save_folder) as it:
+        existing_files = {entry.name for entry in it}
+
     curent_hour = datetime.now().hour
+    tasks = []
     for eva in eva_list:
-        formatted_fchg_url = fchg_url.format(eva=eva)
-        save_api_data(
-            formatted_fchg_url,
-            save_folder / f"{eva}_fchg_{curent_hour:02}.xml",
-            headers=headers,
-            prettify=False,
+        tasks.append(
+            {
+                "formatted_url": fchg_url.format(eva=eva),
+                "save_path": save_folder / f"{eva}_fchg_{curent_hour:02}.xml",
+                "prettify": False,
+            }
         )
 
     print("curent_hour:", curent_hour)
+    skipped = 0
     for eva in eva_list:
         for hour in range(curent_hour, curent_hour + 6):  # fetch this hour and the next 5 hours
             hour = hour % 24
-            formatted_plan_url = plan_url.format(eva=eva, date=date_str_url, hour=f"{hour:02}")
-            save_api_data(
-                formatted_plan_url,
-                save_folder / f"{eva}_plan_{hour:02}.xml",
-                headers=headers,
-                skip_if_exists=True,
+            file_name = f"{eva}_plan_{hour:02}.xml"
+            # Plans do not change, so files from earlier runs today are kept
+            if file_name in existing_files:
+                skipped += 1
+                continue
+            tasks.append(
+                {
+                    "formatted_url": plan_url.format(eva=eva, date=date_str_url, hour=f"{hour:02}"),
+                    "save_path": save_folder / file_name,
+                }
+            )
+    print(f"SKIPPED (exists): {skipped} plan files")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(
+            tqdm(
+                executor.map(lambda task: save_api_data(headers=headers, **task), tasks),
+                total=len(tasks),
+                desc="Fetching XML files",
             )
+        )
 
     print("Done")
     return save_folder
@@ -0,0 +1,20 @@
+"""Gunicorn configuration for serving the app in production.
+
+A single worker process serves requests from a pool of threads. The API handlers mostly wait on
+Postgres, and psycopg2 releases the GIL while waiting, so the threads overlap their database I/O.
+With a single process, the scheduled jobs, the in-memory cache and the rate limit counters exist once.
+"""
+
+from config import DB_POOL_MAX_CONN
+
+bind = "0.0.0.0:5000"
+workers = 1
+worker_class = "gthread"
+# One thread per pooled database connection, so requests never wait for a free connection
+threads = DB_POOL_MAX_CONN
+
+
+def post_worker_init(worker):
+    from server import start_background_jobs
+
+    start_background_jobs()
@@ -1,36 +1,87 @@
+import argparse
 import json
+import multiprocessing
 import os
 import shutil
+import subprocess
 import sys
+import tempfile
 import xml.etree.ElementTree as ET
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 
 import pandas as pd
 from tqdm import tqdm
 
+from config import IMPORT_PROCESSES
 from db_utils import (
     bulk_insert_train_data,
     get_db_connection,
     is_date_processed,
     mark_date_as_processed,
+    prepare_import_statements,
+    refresh_station_views,
 )
 
+PLAN_COLUMNS = [
+    "id",
+    "station",
+    "train_name",
+    "final_destination_station",
+    "train_type",
+    "arrival_planned_time",
+    "departure_planned_time",
+    "train_line_ride_id",
+    "train_line_station_num",
+]
+
+FCHG_COLUMNS = [
+    "id",
+    "arrival_change_time",
+    "departure_change_time",
+    "arrival_cancellation_time",
+    "departure_cancellation_time",
+]
+
+
+# Alternative station names of the current parse worker, set by init_plan_worker
+_worker_alternative_station_names = None
+
+
+@lru_cache(maxsize=1)
+def load_alternative_station_names(path="alternative_station_name_to_station_name.json"):
+    """Load the alternative station name mapping once and return it as a read-only mapping."""
+    alt_station_file = Path(path)
+    if not alt_station_file.exists():
+        raise FileNotFoundError(f"Alternative station names file {alt_station_file} does not exist")
+    with alt_station_file.open("r") as f:
+        return MappingProxyType(json.load(f))
+
 
 def get_plan_xml_rows(xml_path, alternative_station_names):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+    context = ET.iterparse(xml_path, events=("start", "end"))
+    _, root = next(context)
     station = root.get("station")
     if station in alternative_station_names:
         station = alternative_station_names[station]
 
     rows = []
-    for s in root.findall("s"):
+    for event, s in context:
+        if event != "end" or s.tag != "s":
+            continue
+
+        # Look up each child element once and reuse it below
+        tl = s.find("tl")
+        ar = s.find("ar")
+        dp = s.find("dp")
+
         s_id = s.get("id")
-        train_type = s.find("tl").get("c") if s.find("tl") is not None else None
-        train_number = s.find("tl").get("n") if s.find("tl") is not None else None
-        ar_train_line_number = s.find("ar").get("l") if s.find("ar") is not None else None
-        dp_train_line_number = s.find("dp").get("l") if s.find("dp") is not None else None
+        train_type = tl.get("c") if tl is not None else None
+        train_number = tl.get("n") if tl is not None else None
+        ar_train_line_number = ar.get("l") if ar is not None else None
+        dp_train_line_number = dp.get("l") if dp is not None else None
 
         if train_type in ["IC", "ICE", "EC"]:
             train_name = f"{train_type} {train_number}"
@@ -42,39 +93,119 @@ def get_plan_xml_rows(xml_path, alternative_station_names):
             else:
                 train_name = train_type
 
-        s_id_split = s_id.split("-")
+        # Only the last "-" separates the station number, the ride id itself may contain more
+        train_line_ride_id, _, train_line_station_num = s_id.rpartition("-")
 
-        dp_ppth = s.find("dp").get("ppth") if s.find("dp") is not None else None  # departure planed path
+        dp_ppth = dp.get("ppth") if dp is not None else None  # departure planed path
         if dp_ppth is None:
             final_destination_station = station
         else:
-            final_destination_station = dp_ppth.split("|")[-1]
+            final_destination_station = dp_ppth.rpartition("|")[2]
 
+        # Rows are plain tuples in PLAN_COLUMNS order, which pandas turns into columns cheaply
         rows.append(
-            {
-                "id": s_id,
-                "station": station,
-                "train_name": train_name,
-                "final_destination_station": final_destination_station,
-                "train_type": train_type,
-                "arrival_planned_time": (s.find("ar").get("pt") if s.find("ar") is not None else None),
-                "departure_planned_time": (s.find("dp").get("pt") if s.find("dp") is not None else None),
-                "train_line_ride_id": "-".join(s_id_split[:-1]),
-                "train_line_station_num": int(s_id_split[-1]),
-            }
+            (
+                s_id,
+                station,
+                train_name,
+                final_destination_station,
+                train_type,
+                ar.get("pt") if ar is not None else None,
+                dp.get("pt") if dp is not None else None,
+                train_line_ride_id,
+                int(train_line_station_num),
+            )
         )
+
+        # Drop processed elements so memory stays bounded by a single <s> subtree
+        root.clear()
     return rows
 
 
-def get_plan_db(date_folders, alternative_station_names):
-    rows = []
+def list_xml_files(date_folder_path):
+    """Split a date folder into plan and fchg files with a single directory scan.
+
+    Files are named {eva}_plan_{hh}.xml and {eva}_fchg_{hh}.xml. The fchg files are
+    returned sorted, since later snapshots of the same stop must overwrite earlier ones.
+    """
+    plan_files = []
+    fchg_files = []
+    with os.scandir(date_folder_path) as it:
+        for entry in it:
+            kind = entry.name.rpartition("_")[0]
+            if kind.endswith("plan"):
+                plan_files.append(entry.path)
+            elif kind.endswith("fchg"):
+                fchg_files.append(entry.path)
+    fchg_files.sort()
+    return plan_files, fchg_files
+
+
+def get_parse_pool(processes=None, initializer=None, initargs=()):
+    """Create a process pool for parsing XML files.
+
+    The fork start method is used explicitly so workers do not re-import the calling module
+    the way spawn and forkserver would. Forking is only safe in a process without other
+    threads, so the server runs imports through import_data_in_subprocess.
+    """
+    if processes is None:
+        processes = IMPORT_PROCESSES or getattr(os, "process_cpu_count", os.cpu_count)() or 1
+    return multiprocessing.get_context("fork").Pool(
+        processes=processes, initializer=initializer, initargs=initargs
+    )
+
+
+class LazyParsePool:
+    """A parse pool that only starts its workers once a date actually needs parsing."""
+
+    def __init__(self, **pool_kwargs):
+        self.pool_kwargs = pool_kwargs
+        self.pool = None
+
+    def __getattr__(self, name):
+        if self.pool is None:
+            self.pool = get_parse_pool(**self.pool_kwargs)
+        return getattr(self.pool, name)
 
-    for date_folder_path in tqdm(date_folders, desc="Processing plan files"):
-        for xml_path in sorted(date_folder_path.iterdir()):
-            if "plan" in xml_path.name:
-                rows.extend(get_plan_xml_rows(xml_path, alternative_station_names))
+    def __enter__(self):
+        return self
 
-    out_df = pd.DataFrame(rows)
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.__exit__(*exc_info)
+
+
+def init_plan_worker(alternative_station_names):
+    """Hand the station name mapping to a parse worker once, instead of with every task."""
+    global _worker_alternative_station_names
+    _worker_alternative_station_names = alternative_station_names
+
+
+def get_plan_file_rows(xml_path):
+    """Parse a single plan file inside a worker set up by init_plan_worker."""
+    return get_plan_xml_rows(xml_path, _worker_alternative_station_names)
+
+
+def get_plan_db(plan_files, alternative_station_names, processes=None):
+    with get_parse_pool(processes, init_plan_worker, (alternative_station_names,)) as pool:
+        return collect_plan_db(queue_plan_files(pool, plan_files), len(plan_files))
+
+
+def queue_plan_files(pool, plan_files):
+    """Queue plan files on a pool set up by init_plan_worker, parsing starts in the background."""
+    # Files are independent, so they are parsed in parallel and collected in any order
+    return pool.imap_unordered(get_plan_file_rows, plan_files, chunksize=64)
+
+
+def collect_plan_db(file_rows_results, total):
+    """Build the plan frame from the rows of queued plan files."""
+    rows = []
+    for file_rows in tqdm(file_rows_results, total=total, desc="Processing plan files"):
+        rows.extend(file_rows)
+
+    out_df = pd.DataFrame(rows, columns=PLAN_COLUMNS)
+    # The frame owns its own column arrays now; drop the tuples before the conversions below
+    del rows
     out_df["arrival_planned_time"] = pd.to_datetime(
         out_df["arrival_planned_time"], format="%y%m%d%H%M", errors="coerce"
     )
@@ -86,42 +217,61 @@ def get_plan_db(date_folders, alternative_station_names):
 
 
 def get_fchg_xml_rows(xml_path, id_to_data):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+    context = ET.iterparse(xml_path, events=("start", "end"))
+    _, root = next(context)
 
-    for s in root.findall("s"):
-        s_id = s.get("id")
-        ar_ct = s.find("ar").get("ct") if s.find("ar") is not None else None  # arrival change
-        dp_ct = s.find("dp").get("ct") if s.find("dp") is not None else None  # departure change
-        ar_clt = s.find("ar").get("clt") if s.find("ar") is not None else None  # arrival cancellation time
-        dp_clt = s.find("dp").get("clt") if s.find("dp") is not None else None  # departure cancellation time
+    for event, s in context:
+        if event != "end" or s.tag != "s":
+            continue
 
-        if ar_clt is None and dp_clt is None:
-            is_canceled = False
-        else:
-            is_canceled = True
+        ar = s.find("ar")
+        dp = s.find("dp")
+        root.clear()
+
+        s_id = s.get("id")
+        ar_ct = ar.get("ct") if ar is not None else None  # arrival change
+        dp_ct = dp.get("ct") if dp is not None else None  # departure change
+        ar_clt = ar.get("clt") if ar is not None else None  # arrival cancellation time
+        dp_clt = dp.get("clt") if dp is not None else None  # departure cancellation time
 
-        if ar_ct is None and dp_ct is None and not is_canceled:
+        if ar_ct is None and dp_ct is None and ar_clt is None and dp_clt is None:
             continue
 
-        # overwrite older data with new data
-        id_to_data[s_id] = {
-            "id": s_id,
-            "arrival_change_time": ar_ct,
-            "departure_change_time": dp_ct,
-            "is_canceled": is_canceled,
-        }
+        # overwrite older data with new data, rows are in FCHG_COLUMNS order
+        id_to_data[s_id] = (s_id, ar_ct, dp_ct, ar_clt, dp_clt)
 
 
-def get_fchg_db(date_folders):
+def get_fchg_file_rows(xml_path):
+    """Parse a single fchg file into a mapping of stop id to row."""
     id_to_data = {}
+    get_fchg_xml_rows(xml_path, id_to_data)
+    return id_to_data
+
 
-    for date_folder_path in tqdm(date_folders, desc="Processing fchg files"):
-        for xml_path in sorted(date_folder_path.iterdir()):
-            if "fchg" in xml_path.name:
-                get_fchg_xml_rows(xml_path, id_to_data)
+def get_fchg_db(fchg_files, processes=None):
+    with get_parse_pool(processes) as pool:
+        return collect_fchg_db(queue_fchg_files(pool, fchg_files), len(fchg_files))
 
-    out_df = pd.DataFrame(id_to_data.values())
+
+def queue_fchg_files(pool, fchg_files):
+    """Queue fchg files on a pool, parsing starts in the background."""
+    # Results are returned in file order so newer snapshots still overwrite older ones
+    return pool.imap(get_fchg_file_rows, fchg_files, chunksize=64)
+
+
+def collect_fchg_db(file_data_results, total):
+    """Build the fchg frame from the stops of queued fchg files, merged in file order."""
+    id_to_data = {}
+    for file_data in tqdm(file_data_results, total=total, desc="Processing fchg files"):
+        id_to_data.update(file_data)
+
+    out_df = pd.DataFrame(list(id_to_data.values()), columns=FCHG_COLUMNS)
+    del id_to_data
+    # A stop is canceled if either its arrival or its departure has a cancellation time
+    out_df["is_canceled"] = (
+        out_df["arrival_cancellation_time"].notna() | out_df["departure_cancellation_time"].notna()
+    )
+    out_df = out_df.drop(columns=["arrival_cancellation_time", "departure_cancellation_time"])
     out_df["arrival_change_time"] = pd.to_datetime(
         out_df["arrival_change_time"], format="%y%m%d%H%M", errors="coerce"
     )
@@ -146,25 +296,30 @@ def delete_date_folder(date_folder):
         print(f"Error deleting folder {date_folder}: {e!s}")
 
 
-def process_date_folder(date_folder, alternative_station_names, conn):
-    """Process a single date folder and insert its data into the database."""
+def process_date_folder(date_folder, conn, pool):
+    """Process a single date folder and insert its data into the database.
+
+    The files are parsed on pool, which must be set up by init_plan_worker.
+    Nothing is committed here; the caller commits once per batch of dates.
+    Returns the number of rows inserted, which is 0 for dates that were already processed.
+    """
     date_str = date_folder.name
 
     if is_date_processed(conn, date_str):
         print(f"Date {date_str} has already been processed, skipping...")
-        # Delete the folder since data is already in database
-        delete_date_folder(date_folder)
-        return
+        return 0
 
     print(f"Processing data for date: {date_str}")
 
-    # Create a list with just this date folder
-    date_folders = [date_folder]
-
     # Get the data for this date
-    plan_df = get_plan_db(date_folders, alternative_station_names)
-    fchg_df = get_fchg_db(date_folders)
-    df = pd.merge(plan_df, fchg_df, on="id", how="left")
+    plan_files, fchg_files = list_xml_files(date_folder)
+    # Both kinds are queued up front, so the workers parse the fchg files while the plan frame is built
+    plan_results = queue_plan_files(pool, plan_files)
+    fchg_results = queue_fchg_files(pool, fchg_files)
+    plan_df = collect_plan_db(plan_results, len(plan_files))
+    fchg_df = collect_fchg_db(fchg_results, len(fchg_files))
+    # Join against the fchg frame indexed by id, so its keys are hashed into an index once
+    df = plan_df.join(fchg_df.set_index("id"), on="id", how="left")
 
     # Apply the same transformations as before
     df["is_canceled"] = df["is_canceled"].astype("boolean").fillna(False)
@@ -199,31 +354,31 @@ def process_date_folder(date_folder, alternative_station_names, conn):
             "departure_planned_time",
             "departure_change_time",
         ]
-    ].astype(
-        {
-            "station": "string",
-            "train_name": "string",
-            "final_destination_station": "string",
-            "delay_in_min": "int32",
-            "is_canceled": "boolean",
-            "train_type": "string",
-            "train_line_ride_id": "string",
-            "train_line_station_num": "int32",
-        }
-    )
+    ]
+    # Only the delay needs a cast, the other columns already have their final types.
+    # Delays are whole minutes and must be written as integers for COPY.
+    df["delay_in_min"] = df["delay_in_min"].astype("int32")
 
     # Insert the data into the database
-    bulk_insert_train_data(conn, df)
+    inserted_rows = bulk_insert_train_data(conn, df)
 
     # Mark the date as processed
     mark_date_as_processed(conn, date_str)
-    print(f"Successfully processed and stored data for {date_str}")
+    print(f"Successfully processed data for {date_str}")
+    return inserted_rows
 
-    # Delete the folder since data is now in database
-    delete_date_folder(date_folder)
+
+def commit_date_folders(conn, date_folders, processed_dates):
+    """Commit the pending batch and clean up the folders whose data is now stored."""
+    conn.commit()
+    for date_folder in date_folders:
+        processed_dates.append(date_folder.name)
+        # Delete the folder since data is now in database
+        delete_date_folder(date_folder)
+    date_folders.clear()
 
 
-def import_data(xml_dir="/app/data/xml", alternative_station_names=None, specific_date=None):
+def import_data(xml_dir="/app/data/xml", alternative_station_names=None, specific_date=None, batch_size=10):
     """
     Main function to import data that can be called directly or via command line.
 
@@ -231,50 +386,70 @@ def import_data(xml_dir="/app/data/xml", alternative_station_names=None, specifi
         xml_dir (str, optional): Path to the directory where XML files are stored.
             If None, uses default path.
         alternative_station_names (dict, optional): Dict of alternative station names.
-            If None, loads from json file.
+            If None, loads from json file (cached after the first load).
         specific_date (str, optional): Specific date to process in YYYY-MM-DD format.
             If None, processes all unprocessed dates.
+        batch_size (int, optional): Number of dates inserted per transaction. A date that
+            fails is rolled back on its own without affecting the rest of the batch.
 
     Returns:
         list: List of processed date strings
     """
     processed_dates = []
+    # Dates that stored new rows, only these make refreshing the station views worthwhile
+    dates_with_new_rows = []
 
     if not xml_dir.exists():
         raise FileNotFoundError(f"Data directory {xml_dir} does not exist")
 
     # Load alternative station names if not provided
     if alternative_station_names is None:
-        alt_station_file = Path("alternative_station_name_to_station_name.json")
-        if not alt_station_file.exists():
-            raise FileNotFoundError(f"Alternative station names file {alt_station_file} does not exist")
-        with alt_station_file.open("r") as f:
-            alternative_station_names = json.load(f)
+        alternative_station_names = load_alternative_station_names()
 
     # Get database connection
     conn = get_db_connection()
     try:
-        # If specific date is provided, only process that date
-        if specific_date:
-            date_folder = xml_dir / specific_date
-            if not date_folder.exists():
-                raise FileNotFoundError(f"Data folder for date {specific_date} does not exist")
-            process_date_folder(date_folder, alternative_station_names, conn)
-            processed_dates.append(specific_date)
-        else:
-            # Process all date folders that haven't been processed yet
-            date_folders = sorted(
-                [d for d in xml_dir.iterdir() if d.is_dir()],
-                key=lambda x: datetime.strptime(x.name, "%Y-%m-%d"),
-            )
-
-            for date_folder in date_folders:
-                try:
-                    process_date_folder(date_folder, alternative_station_names, conn)
-                    processed_dates.append(date_folder.name)
-                except Exception as e:
-                    print(f"Error processing {date_folder.name}: {e!s}")
-                    continue
+        prepare_import_statements(conn)
+
+        # One pool parses the files of all dates, instead of starting new workers for every date
+        with LazyParsePool(initializer=init_plan_worker, initargs=(alternative_station_names,)) as pool:
+            # If specific date is provided, only process that date
+            if specific_date:
+                date_folder = xml_dir / specific_date
+                if not date_folder.exists():
+                    raise FileNotFoundError(f"Data folder for date {specific_date} does not exist")
+                if process_date_folder(date_folder, conn, pool):
+                    dates_with_new_rows.append(date_folder.name)
+                commit_date_folders(conn, [date_folder], processed_dates)
+            else:
+                # Process all date folders that haven't been processed yet
+                with os.scandir(xml_dir) as it:
+                    date_folders = [Path(entry.path) for entry in it if entry.is_dir()]
+                date_folders.sort(key=lambda x: datetime.strptime(x.name, "%Y-%m-%d"))
+
+                pending_folders = []
+                for date_folder in date_folders:
+                    with conn.cursor() as cur:
+                        cur.execute("SAVEPOINT date_import")
+                    try:
+                        inserted_rows = process_date_folder(date_folder, conn, pool)
+                    except Exception as e:
+                        with conn.cursor() as cur:
+                            cur.execute("ROLLBACK TO SAVEPOINT date_import")
+                        print(f"Error processing {date_folder.name}: {e!s}")
+                        continue
+
+                    if inserted_rows:
+                        dates_with_new_rows.append(date_folder.name)
+                    pending_folders.append(date_folder)
+                    if len(pending_folders) >= batch_size:
+                        commit_date_folders(conn, pending_folders, processed_dates)
+
+                commit_date_folders(conn, pending_folders, processed_dates)
+
+        if dates_with_new_rows:
+            refresh_station_views(conn)
+            conn.commit()
 
     finally:
         conn.close()
@@ -282,12 +457,44 @@ def import_data(xml_dir="/app/data/xml", alternative_station_names=None, specifi
     return processed_dates
 
 
+def import_data_in_subprocess(xml_dir, specific_date=None):
+    """
+    Run import_data in a fresh Python process and return the processed dates.
+
+    The parse pool forks its workers, which can deadlock in a process that runs other
+    threads, like the server with its request, scheduler and logging threads.
+    Raises RuntimeError with the error message of the import if it fails.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_file = Path(tmp_dir) / "result.json"
+        command = [sys.executable, __file__, "--xml-dir", str(xml_dir), "--result-file", str(result_file)]
+        if specific_date:
+            command.append(specific_date)
+        process = subprocess.run(command)
+        # The import writes no result if the process dies before it can report an error
+        if not result_file.exists():
+            raise RuntimeError(f"Import process exited with status {process.returncode}")
+        result = json.loads(result_file.read_text())
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result["processed_dates"]
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import downloaded XML data into the database.")
+    parser.add_argument("date", nargs="?", help="only import this date (YYYY-MM-DD)")
+    parser.add_argument("--xml-dir", type=Path, default=Path("/app/data/xml"))
+    parser.add_argument(
+        "--result-file", type=Path, help="write the processed dates or the error to this file as JSON"
+    )
+    args = parser.parse_args()
     try:
-        # If a date argument is provided, process only that date
-        specific_date = sys.argv[1] if len(sys.argv) > 1 else None
-        processed = import_data(specific_date=specific_date)
+        processed = import_data(xml_dir=args.xml_dir, specific_date=args.date)
         print(f"Successfully processed dates: {', '.join(processed)}")
+        if args.result_file:
+            args.result_file.write_text(json.dumps({"processed_dates": processed}))
     except Exception as e:
         print(f"Error: {e!s}")
+        if args.result_file:
+            args.result_file.write_text(json.dumps({"error": str(e)}))
         sys.exit(1)
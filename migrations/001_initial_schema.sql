@@ -24,7 +24,6 @@ CREATE TABLE IF NOT EXISTS train_data (
 );
 
 -- Create indexes for better query performance
-CREATE INDEX IF NOT EXISTS idx_train_data_station ON train_data(station);
 CREATE INDEX IF NOT EXISTS idx_train_data_train_name ON train_data(train_name);
 CREATE INDEX IF NOT EXISTS idx_train_data_final_destination ON train_data(final_destination_station);
 CREATE INDEX IF NOT EXISTS idx_train_data_delay ON train_data(delay_in_min);
@@ -33,9 +32,6 @@ CREATE INDEX IF NOT EXISTS idx_train_data_train_line_ride_id ON train_data(train
 CREATE INDEX IF NOT EXISTS idx_train_data_arrival_planned ON train_data(arrival_planned_time);
 CREATE INDEX IF NOT EXISTS idx_train_data_departure_planned ON train_data(departure_planned_time);
 
--- Create some useful composite indices for common query patterns
-CREATE INDEX IF NOT EXISTS idx_train_data_station_train ON train_data(station, train_name);
-
 -- Create views for common queries
 -- View for all unique stations
 CREATE OR REPLACE VIEW v_train_stations AS
@@ -61,5 +57,6 @@ SELECT
     delay_in_min as "delayInMin",
     time,
     final_destination_station as "finalDestinationStation",
-    is_canceled as "isCanceled"
+    is_canceled as "isCanceled",
+    id
 FROM train_data;
@@ -0,0 +1,16 @@
+-- Enforce one row per stop of a ride so imports can be retried without duplicates.
+-- Existing duplicates are removed once, before the unique index is created.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_train_data_unique_stop') THEN
+        DELETE FROM train_data a
+        USING train_data b
+        WHERE a.id > b.id
+          AND a.train_line_ride_id = b.train_line_ride_id
+          AND a.train_line_station_num = b.train_line_station_num
+          AND a.station = b.station;
+
+        CREATE UNIQUE INDEX idx_train_data_unique_stop
+            ON train_data (train_line_ride_id, train_line_station_num, station);
+    END IF;
+END $$;
@@ -0,0 +1,24 @@
+-- Precomputed station and train lists, so the API does not aggregate train_data per request.
+-- They are refreshed after every import that stored new data (see refresh_station_views).
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_train_stations AS
+SELECT DISTINCT station
+FROM train_data;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_train_stations_station ON mv_train_stations(station);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_station_trains AS
+SELECT
+    station,
+    train_name,
+    MAX(time) as last_seen
+FROM train_data
+GROUP BY station, train_name;
+
+-- last_seen is included, so the trains of a station are read from the index alone, already
+-- ordered by train_name
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_station_trains_covering
+    ON mv_station_trains(station, train_name)
+    INCLUDE (last_seen);
+
+-- Superseded by idx_mv_station_trains_covering
+DROP INDEX IF EXISTS idx_mv_station_trains_station_train;
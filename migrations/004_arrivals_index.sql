@@ -0,0 +1,13 @@
+-- Matches the arrivals query (station and train, newest first within the date cutoff),
+-- so it becomes an index range scan that returns rows already in order. The id orders
+-- arrivals sharing a time, which the query pages by. The returned columns are included,
+-- so the scan can be answered from the index alone.
+CREATE INDEX IF NOT EXISTS idx_train_data_arrival_pages
+    ON train_data(station, train_name, time DESC, id DESC)
+    INCLUDE (delay_in_min, final_destination_station, is_canceled);
+
+-- Superseded by idx_train_data_arrival_pages, whose leading columns they are
+DROP INDEX IF EXISTS idx_train_data_arrivals;
+DROP INDEX IF EXISTS idx_train_data_station_train_time;
+DROP INDEX IF EXISTS idx_train_data_station_train;
+DROP INDEX IF EXISTS idx_train_data_station;
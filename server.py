@@ -1,22 +1,33 @@
+import atexit
+import base64
 import logging
+import mimetypes
 import os
+import queue
+import threading
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
 from functools import wraps
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-import psycopg2.extras
+import orjson
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, abort, g, has_request_context, jsonify, make_response, request, send_from_directory
+from flask.json.provider import JSONProvider
 from flask_caching import Cache
+from flask_compress import Compress
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import safe_join
 
-from db_utils import get_db_connection, init_database
+from db_utils import execute_prepared, init_database, pooled_db_connection
 from fetch_data import fetch_data
-from import_data_to_postgres import import_data
+from import_data_to_postgres import import_data_in_subprocess
 from update_eva_list import run_eva_list_update
 
 load_dotenv()
@@ -24,6 +35,8 @@ load_dotenv()
 # Set up logging based on environment
 is_production = os.getenv("PRODUCTION", "false").lower() == "true"
 enable_caching = os.getenv("ENABLE_CACHING", "true").lower() == "true"
+# With several server processes, only one of them should run the scheduled jobs
+enable_scheduler = os.getenv("ENABLE_SCHEDULER", "true").lower() == "true"
 log_level = logging.WARNING if is_production else logging.INFO
 
 # Configure all loggers
@@ -33,15 +46,33 @@ logging.basicConfig(level=log_level)
 werkzeug_logger = logging.getLogger("werkzeug")
 werkzeug_logger.setLevel(log_level)
 
+
+class SizeRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that skips the stat calls of each rollover check while records still fit."""
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self.stream.tell() + len(self.format(record)) + 1 < self.maxBytes:
+            return False
+        return super().shouldRollover(record)
+
+
 # Create logs directory if it doesn't exist
 Path("logs").mkdir(exist_ok=True)
 # Create file handler
-file_handler = RotatingFileHandler("logs/app.log", maxBytes=10240, backupCount=10)
+file_handler = SizeRotatingFileHandler("logs/app.log", maxBytes=5 * 1024 * 1024, backupCount=5)
 file_handler.setFormatter(
     logging.Formatter("%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]")
 )
 file_handler.setLevel(log_level)
 
+# Write log records from a background thread so requests do not block on disk I/O
+log_queue = queue.SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+log_listener.start()
+# Flush the records still queued when the process exits
+atexit.register(log_listener.stop)
+
 # Initialize database schema
 print("Initializing database schema...")
 init_database()
@@ -73,13 +104,44 @@ if not xml_dir:
     raise ValueError("No xml directory provided!")
 
 
+# Number of date folders in xml_dir, counted on demand and reset whenever fetches or imports change them
+_num_date_folders = None
+
+
+def get_num_date_folders():
+    """Return the number of date folders in xml_dir, counting them only if not cached."""
+    global _num_date_folders
+    if _num_date_folders is None:
+        try:
+            with os.scandir(xml_dir) as it:
+                _num_date_folders = sum(1 for entry in it if entry.is_dir())
+        except FileNotFoundError:
+            _num_date_folders = 0
+    return _num_date_folders
+
+
+def reset_num_date_folders():
+    """Make the next status request count the date folders again."""
+    global _num_date_folders
+    _num_date_folders = None
+
+
+# Held while fetching, so a manual fetch and the scheduled one never hit the API at the same time
+fetch_lock = threading.Lock()
+
+
 def run_data_fetch():
     """Run the data fetch process."""
+    if not fetch_lock.acquire(blocking=False):
+        app.logger.info("Data fetch already in progress, skipping scheduled run.")
+        return
+
     app.logger.info("Starting scheduled data fetch process...")
 
     try:
         app.logger.info("Fetching new data...")
         save_folder = fetch_data(api_key=api_key, client_id=client_id, xml_dir=xml_dir, eva_dir=eva_dir)
+        reset_num_date_folders()
         app.logger.info(f"Data fetch completed successfully. Data saved to {save_folder}")
         with app.app_context():
             cache.clear()
@@ -87,6 +149,8 @@ def run_data_fetch():
 
     except Exception as e:
         app.logger.error(f"Unexpected error during data fetch process: {e!s}")
+    finally:
+        fetch_lock.release()
 
 
 def run_data_import():
@@ -95,7 +159,8 @@ def run_data_import():
 
     try:
         app.logger.info("Importing data to database...")
-        processed_dates = import_data(xml_dir=xml_dir)
+        processed_dates = import_data_in_subprocess(xml_dir)
+        reset_num_date_folders()
         if processed_dates:
             app.logger.info(f"Successfully processed dates: {', '.join(processed_dates)}")
             with app.app_context():
@@ -120,19 +185,48 @@ def run_eva_list_update_task():
         app.logger.error(f"Unexpected error during EVA list update process: {e!s}")
 
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider serializing with orjson, which writes UTF-8 bytes directly.
+
+    Dates and datetimes are serialized as ISO 8601 strings.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+
 app = Flask(__name__, static_folder="frontend/dist", static_url_path="")
+app.json = OrjsonProvider(app)
+app.config["MAX_CONTENT_LENGTH"] = 1 * 1024 * 1024  # 1MB limit
+# Let a front server such as Apache (mod_xsendfile) or lighttpd send static files from disk
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "false").lower() == "true"
 # Configure CORS
-CORS(app, resources={r"/api/*": {"origins": [base_url]}})  # Restrict CORS to base URL only
+# Restrict CORS to base URL only, letting paging clients read the next page cursor
+CORS(app, resources={r"/api/*": {"origins": [base_url]}}, expose_headers=["X-Next-Before"])
 
-# Add file handler to Flask logger
-app.logger.addHandler(file_handler)
+# Add file handler to Flask logger, through the queue
+app.logger.addHandler(queue_handler)
 app.logger.setLevel(log_level)
 
-# Configure rate limiting
+# Trust X-Forwarded-For from this many reverse proxies, so limits apply per client and not per proxy
+trusted_proxy_count = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+if trusted_proxy_count:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxy_count)
+
+# Configure rate limiting, sharing the counters between workers and restarts if Redis is configured
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["2000 per day", "100 per hour"],
+    storage_uri=os.getenv("RATELIMIT_STORAGE_URI") or os.getenv("CACHE_REDIS_URL") or "memory://",
+    strategy="moving-window",
 )
 
 # Configure caching
@@ -140,105 +234,191 @@ cache_config = {
     "CACHE_TYPE": "SimpleCache" if enable_caching else "NullCache",
     "CACHE_DEFAULT_TIMEOUT": 3600,  # 1 hour default
 }
+# Share cached responses between workers and restarts if a Redis server is configured
+cache_redis_url = os.getenv("CACHE_REDIS_URL")
+if enable_caching and cache_redis_url:
+    cache_config.update(
+        {
+            "CACHE_TYPE": "RedisCache",
+            "CACHE_REDIS_URL": cache_redis_url,
+            # With a prefix, cache.clear() only removes our keys instead of flushing the database
+            "CACHE_KEY_PREFIX": "zugspaet:",
+        }
+    )
 app.config.from_mapping(cache_config)
 cache = Cache(app)
 
+# Compress API responses, the JSON repeats the same station names and keys over and over.
+# Static assets are precompressed by the Docker build instead.
+app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+Compress(app)
+
+
+# str.translate table deleting the non-printable characters of the Basic Multilingual Plane
+_NON_PRINTABLE_TABLE = dict.fromkeys(i for i in range(0x10000) if not chr(i).isprintable())
+
 
 def sanitize_input(value, max_length=500):
     """Basic input sanitization."""
     if value is None:
         return None
-    # Remove any non-printable characters
-    value = "".join(char for char in value if char.isprintable())
+    # Real inputs are almost always printable already, which a single scan confirms
+    if not value.isprintable():
+        # Remove any non-printable characters
+        value = value.translate(_NON_PRINTABLE_TABLE)
+        if not value.isprintable():
+            # Only non-printable characters beyond the table are left, which are rare
+            value = "".join(char for char in value if char.isprintable())
     # Limit length
     return value[:max_length]
 
 
+@contextmanager
+def request_db_connection():
+    """Borrow a pooled connection that is shared by all queries of the current request.
+
+    The connection is checked out on first use and handed back when the request ends, so
+    endpoints running several queries only take one connection from the pool.
+    Outside of a request, every call borrows its own connection.
+    """
+    if not has_request_context():
+        with pooled_db_connection() as conn:
+            yield conn
+        return
+
+    if "db_conn" not in g:
+        g.db_connections = ExitStack()
+        g.db_conn = g.db_connections.enter_context(pooled_db_connection())
+    yield g.db_conn
+
+
+@app.teardown_request
+def release_db_connection(exc):
+    """Return the connection borrowed by the request to the pool."""
+    db_connections = g.pop("db_connections", None)
+    if db_connections is not None:
+        g.pop("db_conn", None)
+        db_connections.close()
+
+
+@cache.memoize(timeout=3600)
 def validate_station_name(station):
     """Validate station name exists in database."""
-    conn = get_db_connection()
-    try:
+    with request_db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT EXISTS(SELECT 1 FROM train_data WHERE station = %s LIMIT 1)",
+            execute_prepared(
+                cur,
+                "station_exists",
+                "SELECT EXISTS(SELECT 1 FROM mv_train_stations WHERE station = $1)",
                 (station,),
             )
             return cur.fetchone()[0]
-    finally:
-        conn.close()
 
 
+@cache.memoize(timeout=3600)
 def validate_train_name(train_name, station):
     """Validate train name exists for given station."""
-    conn = get_db_connection()
-    try:
+    with request_db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT EXISTS(SELECT 1 FROM train_data WHERE station = %s AND train_name = %s LIMIT 1)",
+            execute_prepared(
+                cur,
+                "train_exists",
+                "SELECT EXISTS(SELECT 1 FROM mv_station_trains WHERE station = $1 AND train_name = $2)",
                 (station, train_name),
             )
             return cur.fetchone()[0]
-    finally:
-        conn.close()
 
 
+@cache.memoize(timeout=3600)
 def get_all_stations():
     """Retrieve all unique station names from the database."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute("SELECT station FROM v_train_stations")
-            stations = [row["station"] for row in cur.fetchall()]
+    with request_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_prepared(cur, "all_stations", "SELECT station FROM mv_train_stations ORDER BY station")
+            stations = [row[0] for row in cur.fetchall()]
             return stations
-    finally:
-        conn.close()
 
 
 def get_trains_for_station(station, days_cutoff=30):
     """Retrieve all unique train names for a given station within the date cutoff period."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(
+    with request_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_prepared(
+                cur,
+                "station_trains",
                 """
                 SELECT train_name 
-                FROM v_station_trains 
-                WHERE station = %s 
-                AND last_seen >= CURRENT_DATE - interval '%s days'
+                FROM mv_station_trains 
+                WHERE station = $1 
+                AND last_seen >= CURRENT_DATE - make_interval(days => $2)
                 ORDER BY train_name
                 """,
                 (station, days_cutoff),
             )
-            trains = [row["train_name"] for row in cur.fetchall()]
+            trains = [row[0] for row in cur.fetchall()]
             return trains
-    finally:
-        conn.close()
 
 
-def get_train_arrivals(station, train_name, days_cutoff=30):
-    """Retrieve all arrivals for a specific train at a specific station within the date cutoff period."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(
+def get_train_arrivals(station, train_name, days_cutoff=30, before=None, limit=None):
+    """Retrieve all arrivals for a specific train at a specific station within the date cutoff period.
+
+    With before and limit, only the latest limit arrivals positioned before the (time, id) pair
+    before are returned. The id breaks ties between arrivals sharing a time, so paging neither
+    skips nor repeats arrivals at a page boundary.
+
+    Postgres serializes the arrivals itself, so the rows are never turned into Python objects.
+    Returns the JSON array as text, the number of arrivals and the time and id of the last
+    (oldest) one.
+    """
+    before_time, before_id = before or ("infinity", 0)
+    with request_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_prepared(
+                cur,
+                "train_arrivals",
                 """
-                SELECT 
-                    "delayInMin",
-                    time,
-                    "finalDestinationStation",
-                    "isCanceled"
-                FROM v_train_arrivals 
-                WHERE station = %s 
-                AND train_name = %s 
-                AND time >= CURRENT_DATE - interval '%s days'
-                ORDER BY time DESC
+                SELECT
+                    COALESCE(json_agg(arrival ORDER BY page.time DESC, page.id DESC), '[]')::text,
+                    count(*),
+                    min(page.time),
+                    (array_agg(page.id ORDER BY page.time, page.id))[1]
+                FROM (
+                    SELECT 
+                        "delayInMin",
+                        time,
+                        "finalDestinationStation",
+                        "isCanceled",
+                        id
+                    FROM v_train_arrivals 
+                    WHERE station = $1 
+                    AND train_name = $2 
+                    AND time >= CURRENT_DATE - make_interval(days => $3)
+                    AND (time, id) < ($4, $6)
+                    ORDER BY time DESC, id DESC
+                    LIMIT $5
+                ) page
+                -- The serialized arrivals leave out the id, which is only used for paging
+                CROSS JOIN LATERAL (
+                    SELECT page."delayInMin", page.time, page."finalDestinationStation", page."isCanceled"
+                ) arrival
                 """,
-                (station, train_name, days_cutoff),
+                # LIMIT NULL returns all rows
+                (station, train_name, days_cutoff, before_time, limit, before_id),
             )
-            arrivals = [dict(row) for row in cur.fetchall()]
-            return arrivals
-    finally:
-        conn.close()
+            return cur.fetchone()
+
+
+@cache.memoize(timeout=3600)
+def get_processed_dates():
+    """Retrieve all processed dates as YYYY-MM-DD strings, newest first.
+
+    The list only changes when an import runs, which clears the cache.
+    """
+    with request_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_char(date, 'YYYY-MM-DD') FROM processed_dates ORDER BY date DESC")
+            return [row[0] for row in cur.fetchall()]
 
 
 def require_private_api_key(f):
@@ -252,7 +432,32 @@ def require_private_api_key(f):
     return decorated_function
 
 
+def http_cached(max_age=300):
+    """Let clients and proxies reuse the successful responses of a view for max_age seconds.
+
+    The ETag is a hash of the body, so revalidating unchanged data is answered with an empty 304.
+    It is weak since it stays the same for every content encoding, which lets the 304 be sent
+    before the body would be compressed.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+                response.add_etag(weak=True)
+                response.make_conditional(request)
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
 @app.route("/api/trainStations", methods=["GET"])
+@http_cached()
 @cache.cached(timeout=86400)  # Cache for 24 hours
 def train_stations():
     try:
@@ -263,63 +468,112 @@ def train_stations():
         return jsonify({"error": "Internal server error"}), 500
 
 
-@app.route("/api/trains", methods=["GET"])
-@cache.cached(timeout=3600, query_string=True)  # Cache for 1 hour
-def trains():
-    station = sanitize_input(request.args.get("trainStation"))
-    if not station:
-        return jsonify({"error": "trainStation parameter is required"}), 400
+def validated_query(params, missing_error):
+    """Parse and validate the query parameters of a train endpoint once, before the view runs.
 
-    # Get and validate days_cutoff parameter
-    try:
-        days_cutoff = int(request.args.get("dateCutoff", 30))
-        if days_cutoff < 1:
-            return jsonify({"error": "dateCutoff must be a positive integer"}), 400
-    except ValueError:
-        return jsonify({"error": "dateCutoff must be a valid integer"}), 400
+    params maps required query parameters to the keyword arguments the view receives them
+    as, after sanitizing. The optional dateCutoff parameter is passed as days_cutoff.
+    Invalid requests are answered with a 400 error without calling the view.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function():
+            values = {name: sanitize_input(request.args.get(param)) for param, name in params.items()}
+            if not all(values.values()):
+                return jsonify({"error": missing_error}), 400
 
-    # Validate station exists
-    if not validate_station_name(station):
-        return jsonify({"error": "Invalid station name"}), 400
+            try:
+                days_cutoff = int(request.args.get("dateCutoff", 30))
+            except ValueError:
+                return jsonify({"error": "dateCutoff must be a valid integer"}), 400
+            if days_cutoff < 1:
+                return jsonify({"error": "dateCutoff must be a positive integer"}), 400
 
+            return f(days_cutoff=days_cutoff, **values)
+
+        return decorated_function
+
+    return decorator
+
+
+@app.route("/api/trains", methods=["GET"])
+@http_cached()
+@cache.cached(timeout=3600, query_string=True)  # Cache for 1 hour
+@validated_query({"trainStation": "station"}, "trainStation parameter is required")
+def trains(station, days_cutoff):
     try:
         trains = get_trains_for_station(station, days_cutoff)
+        # Only an empty result needs a second query to tell unknown stations apart
+        if not trains and not validate_station_name(station):
+            return jsonify({"error": "Invalid station name"}), 400
         return jsonify(trains)
     except Exception as e:
         app.logger.error(f"Error in trains: {e!s}")
         return jsonify({"error": "Internal server error"}), 500
 
 
-@app.route("/api/trainArrivals", methods=["GET"])
-@cache.cached(timeout=3600, query_string=True)  # Cache for 1 hour
-def train_arrivals():
-    station = sanitize_input(request.args.get("trainStation"))
-    train_name = sanitize_input(request.args.get("trainName"))
-
-    if not station or not train_name:
-        return (
-            jsonify({"error": "Both trainStation and trainName parameters are required"}),
-            400,
-        )
+# Most arrivals /api/trainArrivals returns per request when paging
+MAX_ARRIVALS_PAGE_SIZE = 200
 
-    # Get and validate days_cutoff parameter
-    try:
-        days_cutoff = int(request.args.get("dateCutoff", 30))
-        if days_cutoff < 1:
-            return jsonify({"error": "dateCutoff must be a positive integer"}), 400
-    except ValueError:
-        return jsonify({"error": "dateCutoff must be a valid integer"}), 400
 
-    # Validate inputs
-    if not validate_station_name(station):
-        return jsonify({"error": "Invalid station name"}), 400
+def encode_arrivals_cursor(arrival_time, arrival_id):
+    """Encode the position of an arrival as an opaque cursor for X-Next-Before.
+
+    The cursor is unpadded URL-safe base64, so clients can pass it on as the before
+    query parameter without URL-encoding it.
+    """
+    position = f"{arrival_time.isoformat()}|{arrival_id}".encode()
+    return base64.urlsafe_b64encode(position).decode().rstrip("=")
+
 
-    if not validate_train_name(train_name, station):
-        return jsonify({"error": "Invalid train name for this station"}), 400
+def decode_arrivals_cursor(cursor):
+    """Return the (time, id) position of an arrivals cursor, raising ValueError if it is invalid."""
+    position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    arrival_time, arrival_id = position.split("|")
+    return datetime.fromisoformat(arrival_time), int(arrival_id)
+
+
+@app.route("/api/trainArrivals", methods=["GET"])
+@http_cached()
+@cache.cached(timeout=3600, query_string=True)  # Cache for 1 hour
+@validated_query(
+    {"trainStation": "station", "trainName": "train_name"},
+    "Both trainStation and trainName parameters are required",
+)
+def train_arrivals(station, train_name, days_cutoff):
+    before = request.args.get("before")
+    if before is not None:
+        try:
+            before = decode_arrivals_cursor(before)
+        except ValueError:
+            return jsonify({"error": "before must be a cursor from the X-Next-Before header"}), 400
+
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return jsonify({"error": "limit must be a valid integer"}), 400
+        if not 1 <= limit <= MAX_ARRIVALS_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_ARRIVALS_PAGE_SIZE}"}), 400
 
     try:
-        arrivals = get_train_arrivals(station, train_name, days_cutoff)
-        return jsonify(arrivals)
+        arrivals_json, num_arrivals, last_time, last_id = get_train_arrivals(
+            station, train_name, days_cutoff, before=before, limit=limit
+        )
+        # Only an empty result needs further queries to tell unknown stations and trains apart
+        if not num_arrivals:
+            if not validate_station_name(station):
+                return jsonify({"error": "Invalid station name"}), 400
+            if not validate_train_name(train_name, station):
+                return jsonify({"error": "Invalid train name for this station"}), 400
+        # The arrivals are serialized already, so they are sent as they are
+        response = app.response_class(arrivals_json, mimetype="application/json")
+        # A full page may be followed by more arrivals, starting before the last one
+        if limit is not None and num_arrivals == limit:
+            response.headers["X-Next-Before"] = encode_arrivals_cursor(last_time, last_id)
+        return response
     except Exception as e:
         app.logger.error(f"Error in train_arrivals: {e!s}")
         return jsonify({"error": "Internal server error"}), 500
@@ -329,16 +583,10 @@ def train_arrivals():
 def system_status():
     try:
         # Check data directory
-        num_date_folders = len([d for d in xml_dir.glob("*") if d.is_dir()])
+        num_date_folders = get_num_date_folders()
 
         # Check database connection and get processed dates
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT date FROM processed_dates ORDER BY date DESC")
-                processed_dates = [row[0].strftime("%Y-%m-%d") for row in cur.fetchall()]
-        finally:
-            conn.close()
+        processed_dates = get_processed_dates()
 
         return jsonify(
             {
@@ -358,8 +606,12 @@ def system_status():
 @require_private_api_key
 def trigger_fetch():
     """Manually trigger data fetch process."""
+    if not fetch_lock.acquire(blocking=False):
+        return jsonify({"status": "error", "error": "Data fetch already in progress"}), 409
+
     try:
         save_folder = fetch_data(api_key=api_key, client_id=client_id, eva_dir=eva_dir, xml_dir=xml_dir)
+        reset_num_date_folders()
         cache.clear()
         app.logger.info("Cache cleared after manual data fetch.")
         return jsonify(
@@ -371,6 +623,8 @@ def trigger_fetch():
     except Exception as e:
         app.logger.error(f"Error in manual data fetch: {e!s}")
         return jsonify({"status": "error", "error": str(e)}), 500
+    finally:
+        fetch_lock.release()
 
 
 @app.route("/private/api/import", methods=["POST"])
@@ -378,7 +632,8 @@ def trigger_fetch():
 def trigger_import():
     """Manually trigger data import process."""
     try:
-        processed_dates = import_data(xml_dir=xml_dir)
+        processed_dates = import_data_in_subprocess(xml_dir)
+        reset_num_date_folders()
         cache.clear()
         app.logger.info("Cache cleared after manual data import.")
         return jsonify({"status": "success", "processed_dates": processed_dates})
@@ -390,14 +645,8 @@ def trigger_import():
 @app.route("/api/lastImport", methods=["GET"])
 def last_import():
     try:
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT MAX(date) FROM processed_dates")
-                last_import_date = cur.fetchone()[0]
-                return jsonify({"lastImport": (last_import_date.isoformat() if last_import_date else None)})
-        finally:
-            conn.close()
+        processed_dates = get_processed_dates()
+        return jsonify({"lastImport": processed_dates[0] if processed_dates else None})
     except Exception as e:
         app.logger.error(f"Error getting last import date: {e!s}")
         return jsonify({"error": "Internal server error"}), 500
@@ -414,6 +663,59 @@ def internal_error(e):
     return jsonify({"error": "Internal server error"}), 500
 
 
+# Vite puts a content hash in the names of the files in assets/, so they can be cached indefinitely
+STATIC_ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+
+# Files of each static folder, once the folder has been found with files in it
+static_files_by_folder = {}
+
+
+def list_static_files(static_folder):
+    """Return the paths of all files in the static folder, walked once instead of statted per request.
+
+    The frontend is built into the image, so the files do not change while the server runs.
+    A missing or empty folder (frontend not built or volume not mounted yet) is not cached,
+    so it is walked again on the next request instead of answering 404 until a restart.
+    """
+    static_files = static_files_by_folder.get(static_folder)
+    if static_files is None:
+        static_files = frozenset(
+            os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, "/")
+            for root, _dirs, names in os.walk(static_folder)
+            for name in names
+        )
+        if static_files:
+            static_files_by_folder[static_folder] = static_files
+    return static_files
+
+
+def serve_static_file(filename):
+    """Send a file from the static folder, preferring its precompressed .gz variant.
+
+    The Docker build gzips the frontend assets ahead of time, so clients accepting gzip
+    get the compressed file without any compression work per request.
+    """
+    static_files = list_static_files(app.static_folder)
+    if filename not in static_files:
+        abort(404)
+    max_age = STATIC_ASSET_MAX_AGE if filename.startswith("assets/") else None
+    if request.accept_encodings["gzip"] and f"{filename}.gz" in static_files:
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response = send_from_directory(
+            app.static_folder, f"{filename}.gz", mimetype=mimetype, max_age=max_age
+        )
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_from_directory(app.static_folder, filename, max_age=max_age)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# Flask's own static route matches every path, so it has to serve the precompressed files too
+app.view_functions["static"] = serve_static_file
+
+
 # Serve static files from the frontend/dist directory
 @app.route("/")
 def serve_frontend():
@@ -423,29 +725,24 @@ def serve_frontend():
 # Catch-all route to handle SPA routing
 @app.route("/<path:path>")
 def catch_all(path):
-    try:
-        requested_path = Path(app.static_folder) / path
-        if not requested_path.resolve().is_relative_to(Path(app.static_folder)):
-            return jsonify({"error": "Invalid path"}), 400
-        return send_from_directory(app.static_folder, path)
-    except (ValueError, RuntimeError):
+    # safe_join only inspects the path string, the file list then decides without touching the disk
+    if safe_join(app.static_folder, path) is None:
         return jsonify({"error": "Invalid path"}), 400
+    return serve_static_file(path)
 
 
-if __name__ == "__main__":
-    # Verify static folder exists
-    if not os.path.exists(app.static_folder):
-        print(f"Warning: Static folder {app.static_folder} does not exist!")
-        os.makedirs(app.static_folder, exist_ok=True)
+def start_scheduler(update_eva_list_now=False):
+    """Create and start the scheduler running the periodic fetch, EVA update and import jobs.
 
-    # Check if EVA list exists and run initial update if not
-    eva_list_file = eva_dir / "current_eva_list.csv"
-    if not eva_list_file.exists():
-        app.logger.info("EVA list file not found. Running initial update...")
-        run_eva_list_update_task()
-
-    # Initialize and start the scheduler
-    scheduler = BackgroundScheduler(timezone="Europe/Berlin")
+    With update_eva_list_now, the EVA list update also runs right away on the scheduler's thread
+    instead of waiting for its daily time.
+    """
+    scheduler = BackgroundScheduler(
+        timezone="Europe/Berlin",
+        # A job still running when it is due again is skipped, missed runs are merged into one,
+        # and a run delayed by a busy worker pool still happens if it is less than 30 seconds late
+        job_defaults={"max_instances": 1, "coalesce": True, "misfire_grace_time": 30},
+    )
     scheduler.add_job(
         run_data_fetch,
         trigger=CronTrigger(hour="*/3"),
@@ -458,6 +755,8 @@ if __name__ == "__main__":
         trigger=CronTrigger(hour=12, minute=0),
         id="eva_list_update",
         name="EVA List Update",
+        # Only overrides the first run, the job follows its cron trigger afterwards
+        **({"next_run_time": datetime.now(timezone.utc)} if update_eva_list_now else {}),
     )
 
     scheduler.add_job(
@@ -468,8 +767,40 @@ if __name__ == "__main__":
     )
 
     scheduler.start()
+    return scheduler
+
+
+def start_background_jobs():
+    """Start the scheduler, with an initial EVA list update if needed, unless it is disabled.
+
+    The initial update runs as a scheduler job, so a slow or failing DB API does not delay the
+    start of the server (and gunicorn does not kill a worker that is still starting up).
+    """
+    if not enable_scheduler:
+        app.logger.info("Scheduler disabled by ENABLE_SCHEDULER, not starting background jobs.")
+        return None
+
+    # Check if EVA list exists and schedule the initial update if not
+    eva_list_file = eva_dir / "current_eva_list.csv"
+    update_eva_list_now = not eva_list_file.exists()
+    if update_eva_list_now:
+        app.logger.info("EVA list file not found. Scheduling initial update...")
+
+    # Initialize and start the scheduler
+    return start_scheduler(update_eva_list_now=update_eva_list_now)
+
+
+if __name__ == "__main__":
+    # Verify static folder exists
+    if not os.path.exists(app.static_folder):
+        print(f"Warning: Static folder {app.static_folder} does not exist!")
+        os.makedirs(app.static_folder, exist_ok=True)
 
-    app.config["MAX_CONTENT_LENGTH"] = 1 * 1024 * 1024  # 1MB limit
+    # In debug mode the reloader runs this module twice, once to watch files and once in the
+    # child process that serves requests. Only the serving process may run the background jobs,
+    # otherwise every job fires twice.
+    if is_production or os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        start_background_jobs()
 
     app.run(
         host="0.0.0.0",
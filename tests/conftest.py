@@ -4,20 +4,38 @@ from unittest.mock import MagicMock
 
 import pytest
 
+TEST_ENV_VARS = {
+    "DB_HOST": "localhost",
+    "DB_PASSWORD": "test_password",
+    "POSTGRES_DB": "test_db",
+    "API_KEY": "test_api_key",
+    "CLIENT_ID": "test_client_id",
+    "PRIVATE_API_KEY": "test_private_key",
+    "BASE_URL": "http://localhost",
+    "DATA_DIR": "/tmp/test_data",
+    "XML_DIR": "/tmp/test_xml",
+    "EVA_DIR": "/tmp/test_eva",
+}
+
+
+def set_test_env_vars(monkeypatch):
+    """Set the test environment variables through monkeypatch."""
+    for name, value in TEST_ENV_VARS.items():
+        monkeypatch.setenv(name, value)
+
 
 @pytest.fixture(autouse=True)
 def mock_env_vars(monkeypatch):
     """Set up test environment variables."""
-    monkeypatch.setenv("DB_HOST", "localhost")
-    monkeypatch.setenv("DB_PASSWORD", "test_password")
-    monkeypatch.setenv("POSTGRES_DB", "test_db")
-    monkeypatch.setenv("API_KEY", "test_api_key")
-    monkeypatch.setenv("CLIENT_ID", "test_client_id")
-    monkeypatch.setenv("PRIVATE_API_KEY", "test_private_key")
-    monkeypatch.setenv("BASE_URL", "http://localhost")
-    monkeypatch.setenv("DATA_DIR", "/tmp/test_data")
-    monkeypatch.setenv("XML_DIR", "/tmp/test_xml")
-    monkeypatch.setenv("EVA_DIR", "/tmp/test_eva")
+    set_test_env_vars(monkeypatch)
+
+
+@pytest.fixture(scope="module")
+def module_env_vars():
+    """Set up test environment variables for module-scoped fixtures, which run before mock_env_vars."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        set_test_env_vars(monkeypatch)
+        yield
 
 
 @pytest.fixture
@@ -53,6 +53,111 @@ class TestGetDbConnection:
         assert mock_connect.call_count == 3
 
 
+class TestPooledDbConnection:
+    """Tests for pooled_db_connection function."""
+
+    def test_connection_is_returned_to_pool(self, mock_db_connection):
+        """Test that a healthy connection is handed out and put back afterwards."""
+        from db_utils import pooled_db_connection
+
+        mock_conn, mock_cursor = mock_db_connection
+        mock_conn.closed = 0
+        mock_pool = MagicMock()
+        mock_pool.getconn.return_value = mock_conn
+
+        with patch("db_utils.get_connection_pool", return_value=mock_pool):
+            with pooled_db_connection() as conn:
+                assert conn is mock_conn
+
+        mock_cursor.execute.assert_called_once_with("SELECT 1")
+        assert mock_conn.autocommit is True
+        mock_pool.putconn.assert_called_once_with(mock_conn, close=False)
+
+    def test_broken_connection_is_replaced(self, mock_db_connection):
+        """Test that a connection failing the health check is discarded."""
+        from db_utils import pooled_db_connection
+
+        broken_conn, broken_cursor = mock_db_connection
+        broken_cursor.execute.side_effect = psycopg2.OperationalError("server closed the connection")
+        fresh_conn = MagicMock()
+        fresh_conn.closed = 0
+        mock_pool = MagicMock()
+        mock_pool.getconn.side_effect = [broken_conn, fresh_conn]
+
+        with patch("db_utils.get_connection_pool", return_value=mock_pool):
+            with pooled_db_connection() as conn:
+                assert conn is fresh_conn
+
+        assert mock_pool.putconn.call_args_list == [
+            ((broken_conn,), {"close": True}),
+            ((fresh_conn,), {"close": False}),
+        ]
+
+
+class TestConnectionPool:
+    """Tests for get_connection_pool and close_connection_pool functions."""
+
+    def test_pool_is_closed_at_exit(self):
+        """Test that the pool is created once and its connections are closed on shutdown."""
+        from db_utils import close_connection_pool, get_connection_pool
+
+        with (
+            patch("db_utils.psycopg2.pool.ThreadedConnectionPool") as mock_pool_cls,
+            patch("db_utils.atexit.register") as mock_register,
+        ):
+            pool = get_connection_pool()
+            assert get_connection_pool() is pool
+            mock_pool_cls.assert_called_once()
+            mock_register.assert_called_once_with(close_connection_pool)
+
+            close_connection_pool()
+            pool.closeall.assert_called_once()
+            assert get_connection_pool() is not None
+            assert mock_pool_cls.call_count == 2
+
+        close_connection_pool()
+
+
+class TestExecutePrepared:
+    """Tests for execute_prepared function."""
+
+    def test_statement_is_prepared_once_per_connection(self, mock_db_connection):
+        """Test that the statement is only prepared on its first execution."""
+        from db_utils import execute_prepared
+
+        _mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.connection.prepared_statements = set()
+
+        for station in ["Berlin Hbf", "München Hbf"]:
+            execute_prepared(mock_cursor, "station_exists", "SELECT $1 = 'x'", (station,))
+
+        assert [c.args for c in mock_cursor.execute.call_args_list] == [
+            ("PREPARE station_exists AS SELECT $1 = 'x'",),
+            ("EXECUTE station_exists (%s)", ("Berlin Hbf",)),
+            ("EXECUTE station_exists (%s)", ("München Hbf",)),
+        ]
+
+
+class TestPrepareImportStatements:
+    """Tests for prepare_import_statements function."""
+
+    def test_prepared_statements_are_executed(self, mock_db_connection):
+        """Test that the date helpers run the statements prepared on the connection."""
+        from db_utils import is_date_processed, mark_date_as_processed, prepare_import_statements
+
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchone.return_value = (False,)
+
+        prepare_import_statements(mock_conn)
+        is_date_processed(mock_conn, "2024-01-01")
+        mark_date_as_processed(mock_conn, "2024-01-01")
+
+        statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+        assert statements[0].startswith("PREPARE is_date_processed (date) AS")
+        assert statements[1].startswith("PREPARE mark_date_as_processed (date) AS")
+        assert statements[2:] == ["EXECUTE is_date_processed (%s)", "EXECUTE mark_date_as_processed (%s)"]
+
+
 class TestIsDateProcessed:
     """Tests for is_date_processed function."""
 
@@ -86,11 +191,12 @@ class TestMarkDateAsProcessed:
         """Test marking a date as processed."""
         from db_utils import mark_date_as_processed
 
-        mock_conn, _mock_cursor = mock_db_connection
+        mock_conn, mock_cursor = mock_db_connection
 
         mark_date_as_processed(mock_conn, "2024-01-01")
 
-        mock_conn.commit.assert_called_once()
+        mock_cursor.execute.assert_called_once()
+        mock_conn.commit.assert_not_called()
 
 
 class TestBulkInsertTrainData:
@@ -107,12 +213,12 @@ class TestBulkInsertTrainData:
 
         mock_cursor.execute.assert_not_called()
 
-    @patch("db_utils.execute_values")
-    def test_bulk_insert_with_data(self, mock_execute_values, mock_db_connection):
-        """Test bulk insert with valid data."""
+    def test_bulk_insert_with_data(self, mock_db_connection):
+        """Test bulk insert streams the data via COPY."""
         from db_utils import bulk_insert_train_data
 
-        mock_conn, _mock_cursor = mock_db_connection
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.rowcount = 2
         df = pd.DataFrame(
             {
                 "station": ["Berlin Hbf", "München Hbf"],
@@ -120,7 +226,43 @@ class TestBulkInsertTrainData:
             }
         )
 
+        assert bulk_insert_train_data(mock_conn, df) == 2
+
+        mock_cursor.copy_expert.assert_called_once()
+        sql, buf = mock_cursor.copy_expert.call_args.args
+        assert sql.startswith("COPY tmp_train_data (station, delay) FROM STDIN")
+        assert buf.read() == "Berlin Hbf,5\nMünchen Hbf,10\n"
+        executed = [c.args[0] for c in mock_cursor.execute.call_args_list]
+        assert "CREATE TEMP TABLE IF NOT EXISTS tmp_train_data ON COMMIT DROP" in executed[0]
+        assert "ON CONFLICT DO NOTHING" in executed[1]
+        assert executed[2] == "TRUNCATE tmp_train_data"
+        mock_conn.commit.assert_not_called()
+
+    def test_bulk_insert_writes_missing_values_as_empty_fields(self, mock_db_connection):
+        """Test that NaN and NaT are serialized as empty (NULL) fields."""
+        from db_utils import bulk_insert_train_data
+
+        mock_conn, mock_cursor = mock_db_connection
+        df = pd.DataFrame(
+            {
+                "station": ["Berlin Hbf", "München Hbf"],
+                "arrival_planned_time": pd.to_datetime(["2024-01-01 10:05", None]),
+                "delay_in_min": [1.5, float("nan")],
+            }
+        )
+
         bulk_insert_train_data(mock_conn, df)
 
-        mock_execute_values.assert_called_once()
-        mock_conn.commit.assert_called_once()
+        _sql, buf = mock_cursor.copy_expert.call_args.args
+        assert buf.read() == "Berlin Hbf,2024-01-01 10:05:00,1.5\nMünchen Hbf,,\n"
+
+    def test_bulk_insert_streams_in_chunks(self):
+        """Test that rows are serialized lazily in chunks."""
+        from db_utils import DataFrameCsvStream
+
+        df = pd.DataFrame({"station": ["A", "B", "C"], "delay": [1, 2, 3]})
+        stream = DataFrameCsvStream(df, chunk_size=2)
+
+        assert stream.read(8192) == "A,1\nB,2\n"
+        assert stream.read(8192) == "C,3\n"
+        assert stream.read(8192) == ""
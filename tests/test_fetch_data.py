@@ -1,5 +1,6 @@
 """Unit tests for fetch_data.py."""
 
+from datetime import datetime
 from unittest.mock import patch
 
 import pytest
@@ -24,13 +25,65 @@ class TestRateLimiter:
         """Test multiple token acquisitions."""
         from fetch_data import RateLimiter
 
-        limiter = RateLimiter(rate=5, per=60)
+        with patch("fetch_data.current_time", return_value=100.0):
+            limiter = RateLimiter(rate=5, per=60)
 
-        for _ in range(5):
-            limiter.acquire()
+            for _ in range(5):
+                limiter.acquire()
 
         assert limiter.tokens == 0
 
+    def test_rate_limiter_sleeps_for_token_deficit(self):
+        """Test that an empty bucket sleeps exactly until the next token accrues."""
+        from fetch_data import RateLimiter
+
+        with patch("fetch_data.current_time", return_value=100.0):
+            limiter = RateLimiter(rate=2, per=60)
+            limiter.tokens = 0
+
+        # Time advances only when the limiter sleeps
+        clock = [100.0]
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with (
+            patch("fetch_data.current_time", side_effect=lambda: clock[0]),
+            patch("fetch_data.time.sleep", side_effect=fake_sleep),
+        ):
+            assert limiter.acquire() is True
+
+        assert sleeps == [30.0]
+        assert limiter.tokens == pytest.approx(0)
+
+    def test_rate_limiter_burst_after_idle_period(self):
+        """Test that an idle period never allows more than a full bucket at once."""
+        from fetch_data import RateLimiter
+
+        # Time advances only when the test or the limiter sleeps
+        clock = [0.0]
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with (
+            patch("fetch_data.current_time", side_effect=lambda: clock[0]),
+            patch("fetch_data.time.sleep", side_effect=fake_sleep),
+        ):
+            limiter = RateLimiter(rate=50, per=60)
+            # Idle for the three hours between scheduled runs
+            clock[0] += 3 * 60 * 60
+
+            for _ in range(51):
+                limiter.acquire()
+
+        # The full bucket is spent without waiting, the 51st token has to accrue first
+        assert sleeps == [pytest.approx(60 / 50)]
+
 
 class TestGetApiCredentials:
     """Tests for get_api_credentials function."""
@@ -110,6 +163,29 @@ class TestSaveApiData:
         content = save_path.read_text()
         assert "<data>test</data>" in content
 
+    @responses.activate
+    def test_save_api_data_prettify(self, tmp_path):
+        """Test that prettified XML is indented and keeps its content."""
+        from fetch_data import save_api_data
+
+        url = "https://api.example.com/data"
+        responses.add(
+            responses.GET,
+            url,
+            body='<timetable station="Berlin Hbf"><s id="1"><ar pt="2401011000"/></s></timetable>',
+            status=200,
+            content_type="application/xml",
+        )
+
+        save_path = tmp_path / "test.xml"
+
+        with patch("fetch_data.rate_limiter"):
+            save_api_data(url, save_path, {}, prettify=True)
+
+        content = save_path.read_text()
+        assert content.startswith("<?xml")
+        assert '\n  <s id="1">\n    <ar pt="2401011000" />' in content
+
     @responses.activate
     def test_save_api_data_retry_on_failure(self, tmp_path):
         """Test retry mechanism on failed request."""
@@ -131,7 +207,58 @@ class TestSaveApiData:
 
         with patch("fetch_data.rate_limiter") as mock_limiter:
             mock_limiter.acquire.return_value = True
-            with patch("fetch_data.time.sleep"):  # Skip actual sleep
+            with patch("fetch_data.time.sleep") as mock_sleep:  # Skip actual sleep
                 save_api_data(url, save_path, headers, prettify=False, max_retries=2)
 
         assert save_path.exists()
+        mock_sleep.assert_called_once_with(1)
+        # Each attempt goes through the rate limiter
+        assert mock_limiter.acquire.call_count == 2
+
+
+class TestFetchData:
+    """Tests for fetch_data function."""
+
+    def test_fetch_data_submits_all_requests(self, tmp_path):
+        """Test that fchg and plan files are requested for every EVA."""
+        from fetch_data import fetch_data
+
+        eva_dir = tmp_path / "eva"
+        eva_dir.mkdir()
+        (eva_dir / "current_eva_list.csv").write_text('"name","evas"\n"Berlin Hbf","08011160,08098160"\n')
+
+        with patch("fetch_data.save_api_data") as mock_save:
+            save_folder = fetch_data(
+                api_key="key", client_id="client", xml_dir=tmp_path / "xml", eva_dir=eva_dir, max_workers=4
+            )
+
+        assert save_folder.exists()
+        # One fchg request plus six plan hours per EVA
+        assert mock_save.call_count == 2 * 7
+        saved_names = {c.kwargs["save_path"].name for c in mock_save.call_args_list}
+        assert any("_fchg_" in name for name in saved_names)
+        assert sum("_plan_" in name for name in saved_names) == 12
+
+    def test_fetch_data_skips_existing_plan_files(self, tmp_path):
+        """Test that plan files fetched earlier the same day are not requested again."""
+        from fetch_data import fetch_data
+
+        eva_dir = tmp_path / "eva"
+        eva_dir.mkdir()
+        (eva_dir / "current_eva_list.csv").write_text('"name","evas"\n"Berlin Hbf","08011160,08098160"\n')
+
+        with patch("fetch_data.datetime") as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 1, 1, 10, 0)
+            save_folder = tmp_path / "xml" / "2024-01-01"
+            save_folder.mkdir(parents=True)
+            (save_folder / "08011160_plan_10.xml").touch()
+            (save_folder / "08011160_fchg_10.xml").touch()
+
+            with patch("fetch_data.save_api_data") as mock_save:
+                fetch_data(api_key="key", client_id="client", xml_dir=tmp_path / "xml", eva_dir=eva_dir)
+
+        saved_names = {c.kwargs["save_path"].name for c in mock_save.call_args_list}
+        assert "08011160_plan_10.xml" not in saved_names
+        # fchg files are always fetched again since they change during the day
+        assert "08011160_fchg_10.xml" in saved_names
+        assert len(saved_names) == 2 * 7 - 1
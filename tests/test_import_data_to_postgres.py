@@ -0,0 +1,236 @@
+"""Unit tests for import_data_to_postgres.py."""
+
+from unittest.mock import call, patch
+
+import pandas as pd
+import pytest
+
+PLAN_XML = """<?xml version="1.0" ?>
+<timetable station="Berlin Hbf (tief)">
+  <s id="-123456789-2401011000-5">
+    <tl c="ICE" n="123" />
+    <ar pt="2401011000" l="" />
+    <dp pt="2401011005" ppth="Berlin Südkreuz|Halle (Saale) Hbf|München Hbf" />
+  </s>
+  <s id="987-2401011100-1">
+    <tl c="RB" n="28871" />
+    <ar pt="2401011100" l="23" />
+  </s>
+</timetable>
+"""
+
+FCHG_XML = """<timetable station="Berlin Hbf">
+  <s id="-123456789-2401011000-5">
+    <ar ct="2401011010"><m id="r1" t="d" /></ar>
+    <dp ct="2401011012" />
+  </s>
+  <s id="987-2401011100-1">
+    <ar clt="2401011050" />
+  </s>
+  <s id="555-2401011200-3">
+    <ar><m id="r2" t="h" /></ar>
+  </s>
+</timetable>
+"""
+
+
+class TestListXmlFiles:
+    """Tests for list_xml_files function."""
+
+    def test_list_xml_files(self, tmp_path):
+        """Test that files are classified by type and fchg files are ordered."""
+        from import_data_to_postgres import list_xml_files
+
+        for name in ["8011160_fchg_12.xml", "8011160_plan_10.xml", "8011160_fchg_09.xml", "notes.txt"]:
+            (tmp_path / name).touch()
+
+        plan_files, fchg_files = list_xml_files(tmp_path)
+
+        assert plan_files == [str(tmp_path / "8011160_plan_10.xml")]
+        assert fchg_files == [str(tmp_path / "8011160_fchg_09.xml"), str(tmp_path / "8011160_fchg_12.xml")]
+
+
+class TestGetPlanXmlRows:
+    """Tests for get_plan_xml_rows function."""
+
+    def test_get_plan_xml_rows(self, tmp_path):
+        """Test parsing a plan file into rows."""
+        from import_data_to_postgres import get_plan_xml_rows
+
+        xml_path = tmp_path / "8011160_plan_10.xml"
+        xml_path.write_text(PLAN_XML)
+
+        rows = get_plan_xml_rows(xml_path, {"Berlin Hbf (tief)": "Berlin Hbf"})
+
+        assert rows == [
+            (
+                "-123456789-2401011000-5",
+                "Berlin Hbf",
+                "ICE 123",
+                "München Hbf",
+                "ICE",
+                "2401011000",
+                "2401011005",
+                "-123456789-2401011000",
+                5,
+            ),
+            (
+                "987-2401011100-1",
+                "Berlin Hbf",
+                "RB 23",
+                "Berlin Hbf",
+                "RB",
+                "2401011100",
+                None,
+                "987-2401011100",
+                1,
+            ),
+        ]
+
+
+class TestGetFchgXmlRows:
+    """Tests for get_fchg_xml_rows function."""
+
+    def test_get_fchg_xml_rows(self, tmp_path):
+        """Test that changes and cancellations are collected and unchanged stops skipped."""
+        from import_data_to_postgres import get_fchg_xml_rows
+
+        xml_path = tmp_path / "8011160_fchg_10.xml"
+        xml_path.write_text(FCHG_XML)
+
+        id_to_data = {}
+        get_fchg_xml_rows(xml_path, id_to_data)
+
+        assert id_to_data == {
+            "-123456789-2401011000-5": ("-123456789-2401011000-5", "2401011010", "2401011012", None, None),
+            "987-2401011100-1": ("987-2401011100-1", None, None, "2401011050", None),
+        }
+
+
+class TestGetFchgDb:
+    """Tests for get_fchg_db function."""
+
+    def test_get_fchg_db_derives_is_canceled(self, tmp_path):
+        """Test that cancellation times are turned into the is_canceled flag."""
+        from import_data_to_postgres import get_fchg_db
+
+        xml_path = tmp_path / "8011160_fchg_10.xml"
+        xml_path.write_text(FCHG_XML)
+
+        df = get_fchg_db([xml_path])
+
+        assert list(df.columns) == ["id", "arrival_change_time", "departure_change_time", "is_canceled"]
+        assert df.set_index("id")["is_canceled"].to_dict() == {
+            "-123456789-2401011000-5": False,
+            "987-2401011100-1": True,
+        }
+
+    def test_get_fchg_db_later_files_overwrite_earlier(self, tmp_path):
+        """Test that parallel parsing keeps the newest snapshot of each stop."""
+        from import_data_to_postgres import get_fchg_db
+
+        files = []
+        for hour, change in [("09", "2401011012"), ("12", "2401011020")]:
+            xml_path = tmp_path / f"8011160_fchg_{hour}.xml"
+            xml_path.write_text(FCHG_XML.replace("2401011012", change))
+            files.append(xml_path)
+
+        df = get_fchg_db(files, processes=2)
+
+        departure = df.set_index("id").loc["-123456789-2401011000-5", "departure_change_time"]
+        assert departure == pd.Timestamp("2024-01-01 10:20")
+
+
+class TestLoadAlternativeStationNames:
+    """Tests for load_alternative_station_names function."""
+
+    def test_load_alternative_station_names_is_cached_and_read_only(self, tmp_path):
+        """Test that the mapping is parsed once and cannot be modified."""
+        from import_data_to_postgres import load_alternative_station_names
+
+        path = tmp_path / "names.json"
+        path.write_text('{"Berlin Hbf (tief)": "Berlin Hbf"}')
+
+        names = load_alternative_station_names(str(path))
+        path.write_text("{}")
+
+        assert load_alternative_station_names(str(path)) is names
+        assert names["Berlin Hbf (tief)"] == "Berlin Hbf"
+        with pytest.raises(TypeError):
+            names["Köln Hbf"] = "Köln"
+
+
+class TestImportData:
+    """Tests for import_data function."""
+
+    def test_import_data_commits_in_batches(self, tmp_path, mock_db_connection):
+        """Test that dates share a transaction and failed dates are rolled back alone."""
+        from import_data_to_postgres import import_data
+
+        for date_str in ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]:
+            (tmp_path / date_str).mkdir()
+
+        mock_conn, mock_cursor = mock_db_connection
+        events = []
+        mock_conn.commit.side_effect = lambda: events.append("commit")
+
+        def process(date_folder, conn, pool):
+            if date_folder.name == "2024-01-02":
+                raise ValueError("broken file")
+            return 10
+
+        with (
+            patch("import_data_to_postgres.get_db_connection", return_value=mock_conn),
+            patch("import_data_to_postgres.process_date_folder", side_effect=process),
+            patch(
+                "import_data_to_postgres.delete_date_folder",
+                side_effect=lambda folder: events.append(folder.name),
+            ),
+        ):
+            processed = import_data(xml_dir=tmp_path, alternative_station_names={}, batch_size=2)
+
+        assert processed == ["2024-01-01", "2024-01-03", "2024-01-04"]
+        # Folders are only deleted once their batch has been committed, then the views are refreshed
+        assert events == ["commit", "2024-01-01", "2024-01-03", "commit", "2024-01-04", "commit"]
+        assert call("ROLLBACK TO SAVEPOINT date_import") in mock_cursor.execute.call_args_list
+        assert (
+            call("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_station_trains")
+            in mock_cursor.execute.call_args_list
+        )
+        mock_conn.close.assert_called_once()
+
+    def test_import_data_skips_refresh_without_new_rows(self, tmp_path, mock_db_connection):
+        """Test that no parse workers start and no views are refreshed when every date was processed."""
+        from import_data_to_postgres import import_data
+
+        for date_str in ["2024-01-01", "2024-01-02"]:
+            (tmp_path / date_str).mkdir()
+
+        mock_conn, mock_cursor = mock_db_connection
+
+        with (
+            patch("import_data_to_postgres.get_db_connection", return_value=mock_conn),
+            patch("import_data_to_postgres.is_date_processed", return_value=True),
+            patch("import_data_to_postgres.get_parse_pool") as mock_get_parse_pool,
+            patch("import_data_to_postgres.delete_date_folder"),
+        ):
+            processed = import_data(xml_dir=tmp_path, alternative_station_names={})
+
+        assert processed == ["2024-01-01", "2024-01-02"]
+        mock_get_parse_pool.assert_not_called()
+        executed = [c.args[0] for c in mock_cursor.execute.call_args_list]
+        assert not any("REFRESH MATERIALIZED VIEW" in statement for statement in executed)
+
+    def test_import_data_missing_directory(self, tmp_path):
+        """Test error when the XML directory does not exist."""
+        from import_data_to_postgres import import_data
+
+        with pytest.raises(FileNotFoundError):
+            import_data(xml_dir=tmp_path / "missing", alternative_station_names={})
+
+    def test_import_data_in_subprocess_reports_import_error(self, tmp_path):
+        """Test that an import failing in the child process raises its error message in the caller."""
+        from import_data_to_postgres import import_data_in_subprocess
+
+        with pytest.raises(RuntimeError, match=f"^Data directory {tmp_path / 'missing'} does not exist$"):
+            import_data_in_subprocess(tmp_path / "missing")
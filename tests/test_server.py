@@ -1,14 +1,20 @@
 """Unit tests for server.py."""
 
+import gzip
+import json
+import logging
+import os
 import sys
+from contextlib import nullcontext
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 
-@pytest.fixture
-def app_module(mock_env_vars):
-    """Import and return the server module with side effects mocked."""
+@pytest.fixture(scope="module")
+def app_module(module_env_vars):
+    """Import the server module once for all tests in this file, with side effects mocked."""
     with (
         patch("db_utils.init_database"),
         patch("apscheduler.schedulers.background.BackgroundScheduler") as mock_scheduler_cls,
@@ -27,6 +33,14 @@ def app_module(mock_env_vars):
         yield server
 
 
+@pytest.fixture(autouse=True)
+def reset_app_state(app_module):
+    """Start every test with an empty cache and an uncounted date folder number."""
+    with app_module.app.app_context():
+        app_module.cache.clear()
+    app_module.reset_num_date_folders()
+
+
 @pytest.fixture
 def client(app_module):
     """Create a test client for the app."""
@@ -61,6 +75,8 @@ class TestPublicEndpoints:
 
             assert response.status_code == 200
             assert response.json == ["ICE 123", "RB 45"]
+            # A non-empty result already proves the station exists
+            mock_validate.assert_not_called()
 
     def test_trains_missing_param(self, client):
         """Test error when trainStation param is missing."""
@@ -70,7 +86,10 @@ class TestPublicEndpoints:
 
     def test_trains_invalid_station(self, client):
         """Test error when station name is invalid."""
-        with patch("server.validate_station_name") as mock_validate:
+        with (
+            patch("server.validate_station_name") as mock_validate,
+            patch("server.get_trains_for_station", return_value=[]),
+        ):
             mock_validate.return_value = False
 
             response = client.get("/api/trains?trainStation=InvalidStation")
@@ -78,6 +97,42 @@ class TestPublicEndpoints:
             assert response.status_code == 400
             assert "Invalid station name" in response.json["error"]
 
+    def test_trains_date_cutoff(self, client):
+        """Test that dateCutoff is parsed once and invalid values are rejected before querying."""
+        with patch("server.get_trains_for_station", return_value=["ICE 123"]) as mock_get_trains:
+            assert client.get("/api/trains?trainStation=Berlin Hbf&dateCutoff=7").status_code == 200
+            mock_get_trains.assert_called_once_with("Berlin Hbf", 7)
+
+            response = client.get("/api/trains?trainStation=Berlin Hbf&dateCutoff=abc")
+            assert response.status_code == 400
+            assert "valid integer" in response.json["error"]
+
+            response = client.get("/api/trains?trainStation=Berlin Hbf&dateCutoff=0")
+            assert response.status_code == 400
+            assert "positive integer" in response.json["error"]
+
+            assert mock_get_trains.call_count == 1
+
+    def test_train_stations_revalidation(self, client):
+        """Test that responses carry cache headers and unchanged data is answered with a 304."""
+        with patch("server.get_all_stations", return_value=["Berlin Hbf"]):
+            response = client.get("/api/trainStations")
+            assert response.cache_control.max_age == 300
+            assert response.cache_control.public
+
+            response = client.get("/api/trainStations", headers={"If-None-Match": response.headers["ETag"]})
+            assert response.status_code == 304
+            assert response.data == b""
+
+    def test_json_responses_are_compressed(self, client):
+        """Test that large JSON responses are compressed for clients accepting gzip."""
+        stations = [f"Station {i}" for i in range(200)]
+        with patch("server.get_all_stations", return_value=stations):
+            response = client.get("/api/trainStations", headers={"Accept-Encoding": "gzip"})
+
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert gzip.decompress(response.data) == json.dumps(stations, separators=(",", ":")).encode()
+
     def test_train_arrivals_success(self, client):
         """Test retrieving arrivals for a train."""
         with (
@@ -87,12 +142,109 @@ class TestPublicEndpoints:
         ):
             mock_val_station.return_value = True
             mock_val_train.return_value = True
-            mock_get_arrivals.return_value = [{"time": "10:00", "delayInMin": 5}]
+            mock_get_arrivals.return_value = ('[{"time": "10:00", "delayInMin": 5}]', 1, None, None)
 
             response = client.get("/api/trainArrivals?trainStation=Berlin Hbf&trainName=ICE 123")
 
             assert response.status_code == 200
             assert response.json == [{"time": "10:00", "delayInMin": 5}]
+            mock_val_station.assert_not_called()
+            mock_val_train.assert_not_called()
+
+    def test_train_arrivals_pagination(self, client):
+        """Test that limit and before are passed on and a full page links to the next one."""
+        last_time = datetime(2024, 1, 1, 10, 0)
+        arrivals = ('[{"time": "2024-01-01T10:00:00"}]', 1, last_time, 42)
+        with patch("server.get_train_arrivals", return_value=arrivals) as mock_get_arrivals:
+            query = {"trainStation": "Berlin Hbf", "trainName": "ICE 123", "limit": 1}
+            response = client.get("/api/trainArrivals", query_string=query)
+
+            assert response.status_code == 200
+            cursor = response.headers["X-Next-Before"]
+            # The cursor is URL-safe, so it can be passed on as it is
+            assert cursor.replace("-", "").replace("_", "").isalnum()
+            assert mock_get_arrivals.call_args.kwargs == {"before": None, "limit": 1}
+
+            response = client.get("/api/trainArrivals", query_string={**query, "before": cursor})
+            assert response.status_code == 200
+            assert mock_get_arrivals.call_args.kwargs == {"before": (last_time, 42), "limit": 1}
+
+            response = client.get("/api/trainArrivals", query_string={**query, "limit": 500})
+            assert response.status_code == 400
+
+            for before in ["x", "2024-01-02T08:00:00"]:
+                response = client.get("/api/trainArrivals", query_string={**query, "before": before})
+                assert response.status_code == 400
+
+    def test_train_arrivals_pagination_with_shared_boundary_time(self, client, app_module):
+        """Test that arrivals sharing the time at a page boundary are neither skipped nor repeated."""
+        shared_time = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+        # (time, id) pairs, three arrivals share the time the first page ends with
+        rows = [(datetime(2024, 1, 1, 11, 0, tzinfo=timezone.utc), 1)]
+        rows += [(shared_time, arrival_id) for arrival_id in (2, 3, 4)]
+        rows += [(datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc), 5)]
+
+        def get_page(station, train_name, days_cutoff, before=None, limit=None):
+            """Page through rows the way the arrivals query does, ordered by (time, id) descending."""
+            page = sorted((row for row in rows if before is None or row < before), reverse=True)[:limit]
+            arrivals_json = json.dumps(
+                [{"time": time.isoformat(), "id": arrival_id} for time, arrival_id in page]
+            )
+            return arrivals_json, len(page), page[-1][0], page[-1][1]
+
+        query = {"trainStation": "Berlin Hbf", "trainName": "ICE 123", "limit": 2}
+        seen = []
+        with patch("server.get_train_arrivals", side_effect=get_page):
+            response = client.get("/api/trainArrivals", query_string=query)
+            seen += response.json
+            while "X-Next-Before" in response.headers:
+                before = response.headers["X-Next-Before"]
+                response = client.get("/api/trainArrivals", query_string={**query, "before": before})
+                seen += response.json
+
+        assert [arrival["id"] for arrival in seen] == [1, 4, 3, 2, 5]
+
+    def test_train_arrivals_exposes_next_page_header_to_cors_requests(self, client, app_module):
+        """Test that browsers let cross-origin clients read the next page cursor."""
+        arrivals = ("[]", 0, None, None)
+        with (
+            patch("server.get_train_arrivals", return_value=arrivals),
+            patch("server.validate_station_name", return_value=True),
+            patch("server.validate_train_name", return_value=True),
+        ):
+            response = client.get(
+                "/api/trainArrivals",
+                query_string={"trainStation": "Berlin Hbf", "trainName": "ICE 123"},
+                headers={"Origin": app_module.base_url},
+            )
+
+        assert "X-Next-Before" in response.headers["Access-Control-Expose-Headers"]
+
+    def test_train_arrivals_invalid_train(self, client):
+        """Test that an empty result for an unknown train is reported as invalid."""
+        with (
+            patch("server.validate_station_name", return_value=True),
+            patch("server.validate_train_name", return_value=False),
+            patch("server.get_train_arrivals", return_value=("[]", 0, None, None)),
+        ):
+            response = client.get("/api/trainArrivals?trainStation=Berlin Hbf&trainName=ICE 999")
+
+            assert response.status_code == 400
+            assert "Invalid train name" in response.json["error"]
+
+    def test_train_arrivals_queries_share_one_connection(self, client):
+        """Test that all queries of a request run on a single pooled connection."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.side_effect = [("[]", 0, None, None), (True,), (False,)]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        with patch("server.pooled_db_connection", return_value=nullcontext(mock_conn)) as mock_pooled:
+            response = client.get("/api/trainArrivals?trainStation=Berlin Hbf&trainName=ICE 999")
+
+        assert response.status_code == 400
+        assert mock_cursor.fetchone.call_count == 3
+        mock_pooled.assert_called_once()
 
     def test_train_arrivals_missing_params(self, client):
         """Test error when parameters are missing."""
@@ -104,53 +256,57 @@ class TestPublicEndpoints:
         response = client.get("/api/trainArrivals?trainName=ICE 123")
         assert response.status_code == 400
 
-    def test_system_status_success(self, client, app_module):
+    def test_system_status_success(self, client, app_module, tmp_path):
         """Test system status endpoint."""
-        # Mock pathlib.Path.glob to return some dummy paths (folders)
-        mock_path = MagicMock()
-        mock_path.is_dir.return_value = True
-
-        # We need to patch the global 'xml_dir' in the server module or where it's used
-        # Since 'xml_dir' is imported/defined at top level, we mock the attribute on the module
-        # Manually patch xml_dir on the module instance we have
-        mock_xml_dir = MagicMock()
-        mock_xml_dir.glob.return_value = [mock_path, mock_path]
-        original_xml_dir = app_module.xml_dir
-        app_module.xml_dir = mock_xml_dir
-
-        try:
-            # Mock database connection for processed dates
-            mock_conn = MagicMock()
-            mock_cursor = MagicMock()
-            mock_cursor.fetchall.return_value = []
-            mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-
-            with patch("server.get_db_connection", return_value=mock_conn):
-                response = client.get("/api/status")
-
-                assert response.status_code == 200
-                assert response.json["status"] == "ok"
-                assert response.json["data_directory"]["num_date_folders"] == 2
-        finally:
-            app_module.xml_dir = original_xml_dir
+        (tmp_path / "2024-01-01").mkdir()
+        (tmp_path / "2024-01-02").mkdir()
+        (tmp_path / "notes.txt").touch()
 
-    def test_last_import(self, client):
-        """Test last import date endpoint."""
+        # Mock database connection for processed dates
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = []
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        with (
+            patch.object(app_module, "xml_dir", tmp_path),
+            patch("server.pooled_db_connection", return_value=nullcontext(mock_conn)),
+        ):
+            response = client.get("/api/status")
 
-        # Mock date object
-        mock_date = MagicMock()
-        mock_date.isoformat.return_value = "2024-01-01T23:30:00"
-        mock_cursor.fetchone.return_value = [mock_date]
+            assert response.status_code == 200
+            assert response.json["status"] == "ok"
+            assert response.json["data_directory"]["num_date_folders"] == 2
+
+            # The count is cached until the next fetch or import resets it
+            (tmp_path / "2024-01-03").mkdir()
+            assert client.get("/api/status").json["data_directory"]["num_date_folders"] == 2
+            app_module.reset_num_date_folders()
+            assert client.get("/api/status").json["data_directory"]["num_date_folders"] == 3
 
+    def test_last_import(self, client, app_module):
+        """Test last import date endpoint."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [("2024-01-02",), ("2024-01-01",)]
         mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
-        with patch("server.get_db_connection", return_value=mock_conn):
+        with patch("server.pooled_db_connection", return_value=nullcontext(mock_conn)):
             response = client.get("/api/lastImport")
 
             assert response.status_code == 200
-            assert response.json["lastImport"] == "2024-01-01T23:30:00"
+            assert response.json["lastImport"] == "2024-01-02"
+
+            # The processed dates are cached until the cache is cleared after an import
+            assert client.get("/api/status").json["database"]["processed_dates"] == [
+                "2024-01-02",
+                "2024-01-01",
+            ]
+            assert mock_cursor.execute.call_count == 1
+            with app_module.app.app_context():
+                app_module.cache.clear()
+            client.get("/api/lastImport")
+            assert mock_cursor.execute.call_count == 2
 
 
 class TestPrivateEndpoints:
@@ -178,11 +334,23 @@ class TestPrivateEndpoints:
             assert response.json["status"] == "success"
             mock_fetch.assert_called_once()
 
+    def test_trigger_fetch_while_fetch_running(self, client, app_module):
+        """Test that a fetch is refused while another one holds the lock."""
+        headers = {"X-Private-Api-Key": "test_private_key"}
+
+        with patch("server.fetch_data") as mock_fetch:
+            with app_module.fetch_lock:
+                response = client.post("/private/api/fetch", headers=headers)
+                app_module.run_data_fetch()
+
+            assert response.status_code == 409
+            mock_fetch.assert_not_called()
+
     def test_trigger_import_success(self, client):
         """Test successful import trigger."""
         headers = {"X-Private-Api-Key": "test_private_key"}
 
-        with patch("server.import_data", return_value=["2024-01-01"]) as mock_import:
+        with patch("server.import_data_in_subprocess", return_value=["2024-01-01"]) as mock_import:
             response = client.post("/private/api/import", headers=headers)
 
             assert response.status_code == 200
@@ -209,3 +377,225 @@ class TestHelpers:
         # In Python, \n is printable? No, str.isprintable() is False for \n.
 
         assert sanitize(None) is None
+
+    def test_sanitize_input_removes_non_printable_outside_bmp(self, app_module):
+        """Test that non-printable characters beyond the translate table are removed too."""
+        sanitize = app_module.sanitize_input
+
+        assert sanitize("Köln\u200b Hbf\U000e0001 🚆") == "Köln Hbf 🚆"
+        assert sanitize("x" * 600) == "x" * 500
+
+    def test_json_provider_serializes_times_as_iso(self, app_module):
+        """Test that datetimes are serialized as ISO 8601 strings."""
+        arrival_time = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+        assert app_module.app.json.dumps({"time": arrival_time}) == '{"time":"2024-01-01T10:00:00+00:00"}'
+
+    def test_validate_station_name_is_cached(self, app_module):
+        """Test that repeated validations are answered from the cache until it is cleared."""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (False,)
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        with patch("server.pooled_db_connection", return_value=nullcontext(mock_conn)):
+            assert app_module.validate_station_name("Nowhere") is False
+            assert app_module.validate_station_name("Nowhere") is False
+            assert mock_cursor.fetchone.call_count == 1
+
+            app_module.cache.clear()
+            app_module.validate_station_name("Nowhere")
+            assert mock_cursor.fetchone.call_count == 2
+
+
+class TestRateLimiting:
+    """Tests for the rate limiter configuration."""
+
+    def test_limiter_storage_defaults_to_memory(self, app_module):
+        """Test that counters are kept in memory when no Redis URL is configured."""
+        assert app_module.Limiter.call_args.kwargs["storage_uri"] == "memory://"
+
+    def test_limiter_shares_the_cache_redis(self, mock_env_vars, monkeypatch):
+        """Test that counters are stored in the cache Redis server if one is configured."""
+        monkeypatch.setenv("CACHE_REDIS_URL", "redis://redis:6379/0")
+
+        # The separate import is dropped again afterwards, so the other tests keep the shared module
+        with (
+            patch.dict(sys.modules),
+            patch("db_utils.init_database"),
+            patch("apscheduler.schedulers.background.BackgroundScheduler"),
+            patch("flask_limiter.Limiter") as mock_limiter_cls,
+        ):
+            sys.modules.pop("server", None)
+            import server  # noqa: F401
+
+        assert mock_limiter_cls.call_args.kwargs["storage_uri"] == "redis://redis:6379/0"
+
+
+class TestSizeRotatingFileHandler:
+    """Tests for SizeRotatingFileHandler."""
+
+    def test_rolls_over_only_when_full(self, app_module, tmp_path):
+        """Test that records are appended until the next one would exceed maxBytes."""
+        log_file = tmp_path / "app.log"
+        handler = app_module.SizeRotatingFileHandler(log_file, maxBytes=100, backupCount=1)
+        logger = logging.getLogger("test_size_rotating_file_handler")
+        logger.addHandler(handler)
+        try:
+            with patch("logging.handlers.os.path.isfile", wraps=os.path.isfile) as mock_isfile:
+                logger.warning("x" * 40)
+                logger.warning("x" * 40)
+                # Neither record needed a stat of the log file
+                mock_isfile.assert_not_called()
+
+                logger.warning("x" * 40)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        assert log_file.read_text() == "x" * 40 + "\n"
+        assert (tmp_path / "app.log.1").read_text() == ("x" * 40 + "\n") * 2
+
+
+class TestLogging:
+    """Tests for the application log setup."""
+
+    def test_app_log_is_written_through_queue(self, app_module):
+        """Test that app log records reach the file handler via the background listener."""
+        with patch.object(app_module.file_handler, "handle") as mock_handle:
+            app_module.app.logger.warning("queued %s", "record")
+            # Stopping the listener processes everything still queued
+            app_module.log_listener.stop()
+            app_module.log_listener.start()
+
+        assert app_module.queue_handler in app_module.app.logger.handlers
+        assert app_module.file_handler not in app_module.app.logger.handlers
+        record = mock_handle.call_args.args[0]
+        assert record.getMessage() == "queued record"
+
+
+class TestStaticFiles:
+    """Tests for serving the frontend files."""
+
+    @pytest.fixture
+    def static_folder(self, app_module, tmp_path):
+        """Point the app at a temporary static folder with a precompressed asset."""
+        assets = tmp_path / "assets"
+        assets.mkdir()
+        (assets / "app.js").write_text("console.log(1);")
+        (assets / "app.js.gz").write_bytes(gzip.compress(b"console.log(1);"))
+        (assets / "logo.png").write_bytes(b"png")
+        original_static_folder = app_module.app.static_folder
+        app_module.app.static_folder = str(tmp_path)
+        yield tmp_path
+        app_module.app.static_folder = original_static_folder
+
+    def test_precompressed_asset_is_sent_when_gzip_is_accepted(self, client, static_folder):
+        """Test that the .gz variant is sent with the original content type."""
+        response = client.get("/assets/app.js", headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.mimetype == "text/javascript"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert gzip.decompress(response.data) == b"console.log(1);"
+
+    def test_uncompressed_asset_is_sent_otherwise(self, client, static_folder):
+        """Test that clients without gzip support and files without a .gz variant get the plain file."""
+        response = client.get("/assets/app.js")
+        assert "Content-Encoding" not in response.headers
+        assert response.data == b"console.log(1);"
+
+        response = client.get("/assets/logo.png", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert response.data == b"png"
+
+    def test_hashed_assets_are_cached_for_a_year(self, client, static_folder):
+        """Test that files in assets/ get a long max-age and unknown files a 404."""
+        (static_folder / "favicon.ico").write_bytes(b"ico")
+
+        response = client.get("/assets/logo.png")
+        assert response.cache_control.max_age == 365 * 24 * 60 * 60
+        assert response.cache_control.public
+
+        response = client.get("/favicon.ico")
+        assert response.cache_control.max_age is None
+
+        assert client.get("/assets/missing.js").status_code == 404
+
+    def test_static_files_appear_once_the_folder_is_built(self, client, app_module, tmp_path):
+        """Test that an empty static folder is not cached, so files built later are served."""
+        original_static_folder = app_module.app.static_folder
+        app_module.app.static_folder = str(tmp_path)
+        try:
+            assert client.get("/favicon.ico").status_code == 404
+
+            (tmp_path / "favicon.ico").write_bytes(b"ico")
+            assert client.get("/favicon.ico").data == b"ico"
+        finally:
+            app_module.app.static_folder = original_static_folder
+
+    def test_catch_all_rejects_paths_outside_static_folder(self, app_module, static_folder):
+        """Test that the catch-all route refuses path traversal and serves files inside."""
+        with app_module.app.test_request_context():
+            response, status = app_module.catch_all("../outside.txt")
+            assert status == 400
+
+            response = app_module.catch_all("assets/logo.png")
+            response.direct_passthrough = False
+            assert response.data == b"png"
+
+
+class TestScheduler:
+    """Tests for the background job scheduler."""
+
+    def test_start_scheduler_registers_jobs(self, app_module):
+        """Test that the fetch, EVA update and import jobs are scheduled."""
+        with patch("server.BackgroundScheduler") as mock_scheduler_cls:
+            scheduler = app_module.start_scheduler()
+
+        assert scheduler is mock_scheduler_cls.return_value
+        job_ids = [c.kwargs["id"] for c in scheduler.add_job.call_args_list]
+        assert job_ids == ["data_fetch", "eva_list_update", "daily_data_import"]
+        scheduler.start.assert_called_once()
+        assert mock_scheduler_cls.call_args.kwargs["job_defaults"] == {
+            "max_instances": 1,
+            "coalesce": True,
+            "misfire_grace_time": 30,
+        }
+
+    def test_start_background_jobs_creates_missing_eva_list(self, app_module, tmp_path):
+        """Test that a missing EVA list is scheduled for right away instead of fetched in place."""
+        with (
+            patch.object(app_module, "eva_dir", tmp_path),
+            patch("server.run_eva_list_update_task") as mock_update,
+            patch("server.start_scheduler") as mock_start_scheduler,
+        ):
+            app_module.start_background_jobs()
+            mock_start_scheduler.assert_called_once_with(update_eva_list_now=True)
+
+            (tmp_path / "current_eva_list.csv").touch()
+            app_module.start_background_jobs()
+            mock_start_scheduler.assert_called_with(update_eva_list_now=False)
+
+        mock_update.assert_not_called()
+
+    def test_start_scheduler_runs_eva_list_update_now(self, app_module):
+        """Test that the initial EVA list update is the EVA job's first run."""
+        with patch("server.BackgroundScheduler"):
+            scheduler = app_module.start_scheduler(update_eva_list_now=True)
+
+        eva_job = next(c for c in scheduler.add_job.call_args_list if c.kwargs["id"] == "eva_list_update")
+        assert eva_job.kwargs["next_run_time"].tzinfo is not None
+        data_fetch_job = scheduler.add_job.call_args_list[0]
+        assert "next_run_time" not in data_fetch_job.kwargs
+
+    def test_start_background_jobs_respects_enable_scheduler(self, app_module):
+        """Test that no jobs are started when the scheduler is disabled."""
+        with (
+            patch.object(app_module, "enable_scheduler", False),
+            patch("server.start_scheduler") as mock_start_scheduler,
+        ):
+            assert app_module.start_background_jobs() is None
+
+        mock_start_scheduler.assert_not_called()
@@ -0,0 +1,161 @@
+"""Unit tests for update_eva_list.py."""
+
+import os
+from unittest.mock import patch
+
+import pytest
+import responses
+from responses import matchers
+
+STATIONS_URL = "https://apis.deutschebahn.com/db-api-marketplace/apis/station-data/v2/stations"
+
+
+def make_station(name, number):
+    """Build a station as returned by the StaDa API."""
+    return {
+        "name": name,
+        "category": 1,
+        "evaNumbers": [
+            {
+                "number": number,
+                "isMain": True,
+                "geographicCoordinates": {"coordinates": [13.369, 52.525]},
+            }
+        ],
+    }
+
+
+class TestFetchAndProcessStations:
+    """Tests for fetch_and_process_stations function."""
+
+    @responses.activate
+    def test_fetch_and_process_stations_pages_through_results(self, tmp_path):
+        """Test that all pages are fetched with the credentials and saved sorted by name."""
+        from update_eva_list import fetch_and_process_stations
+
+        # A full page of 100 stations is followed by a partial last page, without a total
+        first_page = [make_station(f"Station {i:03}", 8000000 + i) for i in range(99)]
+        first_page.append(make_station("Berlin Hbf", 8011160))
+        responses.add(responses.GET, STATIONS_URL, json={"result": first_page})
+        responses.add(responses.GET, STATIONS_URL, json={"result": [make_station("Köln Hbf", 8000207)]})
+
+        with (
+            patch("update_eva_list.RateLimiter") as mock_limiter_cls,
+            patch("update_eva_list.time.sleep") as mock_sleep,
+        ):
+            result = fetch_and_process_stations("key", "client", tmp_path)
+
+        assert result is True
+        # Pacing is left to the rate limiter, nothing sleeps after a successful request
+        assert mock_limiter_cls.return_value.acquire.call_count == 2
+        mock_sleep.assert_not_called()
+        assert [call.request.params["offset"] for call in responses.calls] == ["0", "100"]
+        assert responses.calls[0].request.headers["DB-Api-Key"] == "key"
+        lines = (tmp_path / "current_eva_list.csv").read_text().splitlines()
+        assert len(lines) == 102
+        assert lines[:3] == [
+            '"name","category","evas","longitude","latitude"',
+            '"Berlin Hbf",1,"08011160",13.369,52.525',
+            '"Köln Hbf",1,"08000207",13.369,52.525',
+        ]
+
+    @responses.activate
+    def test_fetch_and_process_stations_fetches_remaining_pages_concurrently(self, tmp_path):
+        """Test that once the total is known, the remaining pages are fetched and all stations saved."""
+        from update_eva_list import fetch_and_process_stations
+
+        for offset, count in [(0, 100), (100, 100), (200, 50)]:
+            stations = [make_station(f"Station {offset + i:03}", 8000000 + offset + i) for i in range(count)]
+            responses.add(
+                responses.GET,
+                STATIONS_URL,
+                json={"offset": offset, "limit": 100, "total": 250, "result": stations},
+                match=[matchers.query_param_matcher({"category": "1-3", "offset": offset, "limit": 100})],
+            )
+
+        with patch("update_eva_list.RateLimiter"):
+            result = fetch_and_process_stations("key", "client", tmp_path)
+
+        assert result is True
+        assert sorted(int(call.request.params["offset"]) for call in responses.calls) == [0, 100, 200]
+        lines = (tmp_path / "current_eva_list.csv").read_text().splitlines()
+        assert [line.split(",")[0] for line in lines[1:]] == [f'"Station {i:03}"' for i in range(250)]
+
+    @responses.activate
+    def test_fetch_and_process_stations_retries_malformed_json(self, tmp_path):
+        """Test that a response with a malformed body is retried like a failed request."""
+        from update_eva_list import fetch_and_process_stations
+
+        responses.add(responses.GET, STATIONS_URL, body='{"result": [')
+        responses.add(responses.GET, STATIONS_URL, json={"result": [make_station("Berlin Hbf", 8011160)]})
+
+        with patch("update_eva_list.RateLimiter"), patch("update_eva_list.time.sleep") as mock_sleep:
+            result = fetch_and_process_stations("key", "client", tmp_path)
+
+        assert result is True
+        mock_sleep.assert_called_once()
+        assert 0 <= mock_sleep.call_args.args[0] <= 0.5
+        assert (tmp_path / "current_eva_list.csv").read_text().splitlines()[1] == (
+            '"Berlin Hbf",1,"08011160",13.369,52.525'
+        )
+
+    @responses.activate
+    def test_fetch_and_process_stations_honors_retry_after(self, tmp_path):
+        """Test that a rate limited request is retried after the delay the API asks for."""
+        from update_eva_list import fetch_and_process_stations
+
+        responses.add(responses.GET, STATIONS_URL, status=429, headers={"Retry-After": "3"})
+        responses.add(responses.GET, STATIONS_URL, json={"result": [make_station("Berlin Hbf", 8011160)]})
+
+        with patch("update_eva_list.RateLimiter"), patch("update_eva_list.time.sleep") as mock_sleep:
+            result = fetch_and_process_stations("key", "client", tmp_path)
+
+        assert result is True
+        mock_sleep.assert_called_once_with(3)
+
+    @responses.activate
+    def test_fetch_and_process_stations_keeps_unchanged_list(self, tmp_path):
+        """Test that an unchanged station list does not rewrite the file."""
+        from update_eva_list import fetch_and_process_stations
+
+        for _ in range(2):
+            responses.add(responses.GET, STATIONS_URL, json={"result": [make_station("Berlin Hbf", 8011160)]})
+
+        output_file = tmp_path / "current_eva_list.csv"
+        with patch("update_eva_list.RateLimiter"):
+            assert fetch_and_process_stations("key", "client", tmp_path) is True
+            os.utime(output_file, (0, 0))
+            assert fetch_and_process_stations("key", "client", tmp_path) is True
+
+        assert output_file.stat().st_mtime == 0
+        assert output_file.read_text().splitlines()[1] == '"Berlin Hbf",1,"08011160",13.369,52.525'
+
+    @responses.activate
+    def test_fetch_and_process_stations_replaces_list_atomically(self, tmp_path):
+        """Test that a failed write leaves the previous list intact and no temporary file behind."""
+        from update_eva_list import fetch_and_process_stations
+
+        responses.add(responses.GET, STATIONS_URL, json={"result": [make_station("Berlin Hbf", 8011160)]})
+        output_file = tmp_path / "current_eva_list.csv"
+        output_file.write_text("previous list")
+
+        with (
+            patch("update_eva_list.RateLimiter"),
+            patch("update_eva_list.os.replace", side_effect=OSError("disk full")),
+            pytest.raises(OSError),
+        ):
+            fetch_and_process_stations("key", "client", tmp_path)
+
+        assert output_file.read_text() == "previous list"
+        assert list(tmp_path.iterdir()) == [output_file]
+
+    def test_get_retry_delay_caps_retry_after(self):
+        """Test that an excessive Retry-After cannot stall the update."""
+        from requests import HTTPError, Response
+
+        from update_eva_list import get_retry_delay
+
+        response = Response()
+        response.headers["Retry-After"] = "86400"
+
+        assert get_retry_delay(0, HTTPError(response=response), cap=8) == 8
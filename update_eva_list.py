@@ -1,18 +1,98 @@
+import csv
+import io
 import logging
 import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import pandas as pd
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
-logger = logging.getLogger(__name__)
+from fetch_data import RateLimiter
 
+logger = logging.getLogger(__name__)
 
-def fetch_and_process_stations(api_key, client_id, eva_dir="/app/data/eva", categories="1-3", max_retries=5):
+# Shared session, so the TCP and TLS connection to the DB API is kept alive and reused
+# across pages and retries instead of being opened for every request
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+
+STATIONS_URL = "https://apis.deutschebahn.com/db-api-marketplace/apis/station-data/v2/stations"
+
+# Columns of the rows built by process_stations, as written to the EVA list
+STATION_COLUMNS = ["name", "category", "evas", "longitude", "latitude"]
+
+
+def get_retry_delay(attempt, error, base=0.5, cap=8):
+    """Return how many seconds to wait before retrying a failed request.
+
+    A Retry-After header given in seconds is honored up to cap. Otherwise the delay backs off
+    exponentially with full jitter, so concurrently fetched pages do not retry in lockstep.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(int(retry_after), cap)
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def fetch_stations_page(headers, params, rate_limiter, max_retries=5):
+    """Fetch one page of the station list, retrying failed requests.
+
+    Returns the decoded JSON response, or None if all attempts failed.
+    """
+    offset = params["offset"]
+    for attempt in range(max_retries):
+        rate_limiter.acquire()
+        try:
+            response = session.get(STATIONS_URL, headers=headers, params=params, timeout=10)
+            response.raise_for_status()
+
+            if attempt > 0:
+                logger.info(f"Success after {attempt} attempts for offset {offset}.")
+
+            return orjson.loads(response.content)
+        except (RequestException, ConnectionError, orjson.JSONDecodeError) as e:
+            logger.error(f"Attempt {attempt + 1} failed for offset {offset}: {e}")
+            if attempt < max_retries - 1:
+                delay = get_retry_delay(attempt, e)
+                logger.info(f"Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+            else:
+                logger.error(f"Failed to fetch data after {max_retries} attempts")
+    return None
+
+
+def process_stations(results):
+    """Turn the stations of a page into (name, category, evas, longitude, latitude) rows."""
+    stations = []
+    for station in results:
+        evas = []
+        longitude = None
+        latitude = None
+
+        for eva in station.get("evaNumbers", []):
+            evas.append(f"0{eva.get('number')}")  # add a leading 0 for the eva
+            if eva.get("isMain"):
+                coords = eva.get("geographicCoordinates", {}).get("coordinates")
+                if coords:
+                    longitude = coords[0]
+                    latitude = coords[1]
+
+        stations.append((station.get("name"), station.get("category"), ",".join(evas), longitude, latitude))
+    return stations
+
+
+def fetch_and_process_stations(
+    api_key, client_id, eva_dir="/app/data/eva", categories="1-3", max_retries=5, max_workers=4
+):
     # API configuration
-    base_url = "https://apis.deutschebahn.com/db-api-marketplace/apis/station-data/v2/stations"
     headers = {
         "DB-Api-Key": api_key,
         "DB-Client-Id": client_id,
@@ -20,96 +100,81 @@ def fetch_and_process_stations(api_key, client_id, eva_dir="/app/data/eva", cate
     }
 
     all_stations = []
-    offset = 0
     limit = 100
+    # At most one request per 1/60 s, only waiting when requests actually come in faster
+    rate_limiter = RateLimiter(rate=1, per=1 / 60)
 
-    while True:
-        # Add query parameters
+    def fetch_page(offset):
         params = {"category": categories, "offset": offset, "limit": limit}
+        return fetch_stations_page(headers, params, rate_limiter, max_retries)
 
-        # Attempt API request with retries
-        success = False
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(base_url, headers=headers, params=params, timeout=10)
-                response.raise_for_status()
-
-                if attempt > 0:
-                    logger.info(f"Success after {attempt} attempts for offset {offset}.")
-
-                success = True
-                break
-            except (RequestException, ConnectionError) as e:
-                logger.error(f"Attempt {attempt + 1} failed for offset {offset}: {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying in 2 seconds...")
-                    time.sleep(2)
-                else:
-                    logger.error(f"Failed to fetch data after {max_retries} attempts")
-                    return False
-            finally:
-                time.sleep(1 / 60)  # Rate limiting
-
-        if not success:
-            return False
-
-        # Process the JSON response
-        json_data = response.json()
+    def add_page(offset, json_data):
         results = json_data.get("result", [])
-
-        if not results:
-            break
-
-        # Process station data
-        for station in results:
-            evas = []
-            longitude = None
-            latitude = None
-
-            for eva in station.get("evaNumbers", []):
-                evas.append(f"0{eva.get('number')}")  # add a leading 0 for the eva
-                if eva.get("isMain"):
-                    coords = eva.get("geographicCoordinates", {}).get("coordinates")
-                    if coords:
-                        longitude = coords[0]
-                        latitude = coords[1]
-
-            station_data = {
-                "name": station.get("name"),
-                "category": station.get("category"),
-                "evas": ",".join(evas),
-                "longitude": longitude,
-                "latitude": latitude,
-            }
-            all_stations.append(station_data)
-
+        all_stations.extend(process_stations(results))
         logger.info(f"Fetched {len(results)} stations (offset {offset}). Total: {len(all_stations)}")
+        return results
+
+    json_data = fetch_page(0)
+    if json_data is None:
+        return False
+    results = add_page(0, json_data)
+    total = json_data.get("total")
+
+    if len(results) == limit and total is not None:
+        # The first page tells how many stations there are, so the remaining pages are
+        # fetched concurrently, still sharing the session and the rate limit
+        offsets = range(limit, total, limit)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = list(executor.map(fetch_page, offsets))
+        if any(page is None for page in pages):
+            return False
+        for offset, page in zip(offsets, pages):
+            add_page(offset, page)
+    elif len(results) == limit:
+        # Without a total, pages are fetched one after another until a partial page is returned
+        offset = limit
+        while True:
+            json_data = fetch_page(offset)
+            if json_data is None:
+                return False
+            results = add_page(offset, json_data)
+            offset += limit
+            if len(results) < limit:
+                break
 
-        offset += limit
-        if len(results) < limit:
-            break
-
-    # Create DataFrame
     if not all_stations:
         logger.warning("No stations found.")
         return True  # Or False depending on whether empty result is failure
 
-    df = pd.DataFrame(all_stations)
-    df = df.sort_values("name", ascending=True)
+    # Stations without a name are sorted first instead of failing the comparison
+    all_stations.sort(key=lambda station: station[0] or "")
 
     # Ensure data directory exists
     eva_dir = Path(eva_dir)
     eva_dir.mkdir(parents=True, exist_ok=True)
 
-    # Save to CSV
+    # Render the CSV, quoting everything except numbers
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    writer.writerow(STATION_COLUMNS)
+    writer.writerows(all_stations)
+    content = buffer.getvalue().encode("utf-8")
+
+    # The list rarely changes, so an identical file is left untouched, keeping its mtime
     output_file = eva_dir / "current_eva_list.csv"
-    df.to_csv(
-        output_file,
-        index=False,
-        quoting=2,
-        quotechar='"',
-    )
-    logger.info(f"Successfully processed {len(df)} stations and saved to {output_file}")
+    if output_file.exists() and output_file.read_bytes() == content:
+        logger.info(f"EVA list with {len(all_stations)} stations is unchanged, keeping {output_file}")
+        return True
+
+    # Written next to the list and renamed over it, so a concurrent fetch never reads a partial file
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    try:
+        tmp_file.write_bytes(content)
+        os.replace(tmp_file, output_file)
+    except OSError:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    logger.info(f"Successfully processed {len(all_stations)} stations and saved to {output_file}")
     return True
 
 